@@ -0,0 +1,265 @@
+# bench_parsers.py offline benchmark of every Job Portal's page parser
+#
+# Each case turns a recorded fixture page (see make_fixtures.py) into the portal's DataFrame, at the
+# recorded size and scaled up to more job cards per page. Rows/sec and peak memory are compared with
+# benchmarks/baseline.json and the run fails when a case got slower or hungrier than the tolerances allow.
+# The speed of a shared machine drifts by up to 2x within minutes, so each timed run of a case is paired with a
+# run of a fixed reference workload and speed is compared as the median of case time over reference time. A case
+# that looks slower is measured again up to --confirm times and only fails when it stays slower, and a new baseline
+# takes the median of that many measurements.
+# Run from Web_Scraper/:
+#     python benchmarks/bench_parsers.py                      compare with the baseline
+#     python benchmarks/bench_parsers.py --update-baseline    record new numbers after an intended change
+
+import os
+import re
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIRECTORY))
+
+from config import Config
+
+# The scrapers open their seen-job index on start up, keep the benchmark away from the real one
+STATE_DIRECTORY = tempfile.TemporaryDirectory(prefix='bench-state-')
+Config.seen_index_directory = STATE_DIRECTORY.name
+
+from dice import Wrapper as DiceWrapper
+from zipRecruiter import Wrapper as ZipWrapper
+from indeed import IndeedScraper
+from career_builder import CareerBuilderScraper
+from parsing import HTML_PARSER, make_soup, extract_script
+
+FIXTURE_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, 'fixtures')
+BASELINE_PATH = os.path.join(BENCHMARK_DIRECTORY, 'baseline.json')
+
+# Job cards per page relative to the recorded fixture
+SCALES = (1, 10)
+
+INDEED_JOBCARDS = re.compile(r'(window\.mosaic\.providerData\["mosaic-provider-jobcards"\]\s*=\s*)({.*?});', re.DOTALL)
+CAREERBUILDER_LIST = re.compile(r'(<ol class="data-results">)(.*?)(</ol>)', re.DOTALL)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_DIRECTORY, name), encoding='utf-8') as f:
+        return f.read()
+
+
+# Repeat the jobList of the js_variables script
+def scale_zip(page, scale):
+    script = extract_script(page.encode('utf-8'), 'js_variables')
+    data = json.loads(script)
+    data['jobList'] = data['jobList'] * scale
+    return page.replace(script, json.dumps(data)).encode('utf-8')
+
+
+# Repeat the job cards of the mosaic-provider-jobcards model
+def scale_indeed(page, scale):
+    match = INDEED_JOBCARDS.search(page)
+    data = json.loads(match.group(2))
+    model = data['metaData']['mosaicProviderJobCardsModel']
+    model['results'] = model['results'] * scale
+    return (page[:match.start(2)] + json.dumps(data) + page[match.end(2):]).encode('utf-8')
+
+
+# Repeat the listing cards of the results list
+def scale_careerbuilder(page, scale):
+    return CAREERBUILDER_LIST.sub(lambda match: match.group(1) + match.group(2) * scale + match.group(3), page).encode('utf-8')
+
+
+# Repeat the API results with distinct IDs, the transform drops duplicate IDs
+def scale_dice(response, scale):
+    return [dict(job, id=f"{job['id']}-{copy}") for copy in range(scale) for job in response['data']]
+
+
+# Every case maps to (build the input for a scale, turn the input into a DataFrame)
+def build_cases():
+    zip_wrapper = ZipWrapper()
+    indeed_scraper = IndeedScraper()
+    careerbuilder_scraper = CareerBuilderScraper()
+    dice_wrapper = DiceWrapper()
+
+    zip_page = read_fixture('zip_js_variables.html')
+    indeed_page = read_fixture('indeed_mosaic_data.html')
+    careerbuilder_page = read_fixture('careerbuilder_listing.html')
+    dice_response = json.loads(read_fixture('dice_search.json'))
+
+    return {
+        'zip.parse_page': (lambda scale: scale_zip(zip_page, scale), zip_wrapper.parse_page),
+        'zip.get_data': (lambda scale: scale_zip(zip_page, scale), lambda content: zip_wrapper.get_data(make_soup(content))),
+        'indeed.parse_page': (lambda scale: scale_indeed(indeed_page, scale), indeed_scraper.parse_page),
+        'indeed.get_data': (lambda scale: scale_indeed(indeed_page, scale), lambda content: indeed_scraper.get_data(make_soup(content))),
+        'careerbuilder.get_data': (lambda scale: scale_careerbuilder(careerbuilder_page, scale), lambda content: careerbuilder_scraper.get_data(make_soup(content))),
+        # get_data extends nothing in place, but hand it a fresh list like run() does
+        'dice.get_data': (lambda scale: scale_dice(dice_response, scale), lambda data: dice_wrapper.get_data(list(data), 'Data Analyst')),
+    }
+
+
+# Fixed pure Python work (JSON and string handling like the parsers do) that every case is timed against
+REFERENCE_JOBS = [{'id': index, 'title': f'Senior Data Analyst {index}', 'company': 'Example Corp'} for index in range(2000)]
+
+
+def reference_workload():
+    jobs = json.loads(json.dumps(REFERENCE_JOBS))
+    return sorted(job['title'].lower() for job in jobs)
+
+
+# Several runs, each right after a reference run, then one traced run for peak memory
+def measure(parse, content, repeat):
+    timings = []
+    reference_timings = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        reference_workload()
+        reference_timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        dataframe = parse(content)
+        timings.append(time.perf_counter() - start)
+        rows = 0 if dataframe is None else len(dataframe)
+
+    tracemalloc.start()
+    parse(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        'rows': rows,
+        'seconds': round(best, 6),
+        'rows_per_sec': round(rows / best, 1) if best else 0.0,
+        # Time of the case in reference runs, what the speed check compares
+        'relative_time': round(statistics.median(timing / reference for timing, reference in zip(timings, reference_timings)), 4),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+# Input of every selected case and scale with its parse function, parsed once to warm up caches (compiled
+# patterns, pandas internals) before timing
+def case_inputs(selected=None):
+    inputs = {}
+    for name, (build, parse) in build_cases().items():
+        if selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+        for scale in SCALES:
+            content = build(scale)
+            parse(content)
+            inputs[f'{name}[x{scale}]'] = (parse, content)
+    return inputs
+
+
+# Baseline time over this run's time in reference runs, below 1 the case got slower. None for a baseline
+# recorded before reference runs
+def speed_ratio(result, expected):
+    if not expected or 'relative_time' not in expected:
+        return None
+    return expected['relative_time'] / result['relative_time']
+
+
+# Cases that lost more than speed_tolerance of their speed and more than min_slowdown seconds per run
+def slow_cases(results, baseline, speed_tolerance, min_slowdown):
+    slow = []
+    for case, result in results.items():
+        expected = baseline.get('cases', {}).get(case)
+        ratio = speed_ratio(result, expected)
+        if ratio is None:
+            continue
+        if ratio < 1 - speed_tolerance and result['seconds'] - expected['seconds'] > min_slowdown:
+            slow.append(case)
+    return slow
+
+
+# Cases that parse a different number of rows, got slower or grew more than memory_tolerance in peak memory
+def find_regressions(results, baseline, speed_tolerance, memory_tolerance, min_slowdown):
+    regressions = []
+    slow = slow_cases(results, baseline, speed_tolerance, min_slowdown)
+    for case, result in results.items():
+        expected = baseline.get('cases', {}).get(case)
+        if expected is None:
+            continue
+        if result['rows'] != expected['rows']:
+            regressions.append(f"{case}: {result['rows']} rows, baseline parsed {expected['rows']}")
+        if case in slow:
+            regressions.append(f"{case}: {speed_ratio(result, expected):.2f}x the baseline speed")
+        if result['peak_kb'] > expected['peak_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{case}: peak {result['peak_kb']:.0f} KB, baseline {expected['peak_kb']:.0f} KB")
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"{'case':<32}{'rows':>7}{'rows/sec':>12}{'vs base':>9}{'peak KB':>10}{'vs base':>9}")
+    for case, result in results.items():
+        expected = baseline.get('cases', {}).get(case)
+        ratio = speed_ratio(result, expected)
+        speed = f"{ratio:.2f}x" if ratio is not None else '-'
+        memory = f"{result['peak_kb'] / expected['peak_kb']:.2f}x" if expected else '-'
+        print(f"{case:<32}{result['rows']:>7}{result['rows_per_sec']:>12.0f}{speed:>9}{result['peak_kb']:>10.0f}{memory:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the portal parsers on recorded fixture pages')
+    parser.add_argument('cases', nargs='*', help='only run cases starting with these names, e.g. zip indeed.parse_page')
+    parser.add_argument('--repeat', type=int, default=15, help='timed runs per case, the fastest one counts')
+    parser.add_argument('--confirm', type=int, default=3, help='times a case that looks slower is measured again')
+    parser.add_argument('--speed-tolerance', type=float, default=0.25, help='allowed loss of speed as a fraction of the baseline')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25, help='allowed peak memory growth as a fraction of the baseline')
+    parser.add_argument('--min-slowdown-ms', type=float, default=1.0, help='slowdowns per run below this are never a regression')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    inputs = case_inputs(args.cases)
+    results = {case: measure(parse, content, args.repeat) for case, (parse, content) in inputs.items()}
+    # Timing noise rarely repeats while a real slowdown does, so a slow case keeps its best measurement
+    if args.update_baseline:
+        for case, (parse, content) in inputs.items():
+            relative_times = [results[case]['relative_time']] + [measure(parse, content, args.repeat)['relative_time'] for _ in range(args.confirm)]
+            results[case]['relative_time'] = statistics.median(relative_times)
+    else:
+        for _ in range(args.confirm):
+            slow = slow_cases(results, baseline, args.speed_tolerance, args.min_slowdown_ms / 1000)
+            for case in slow:
+                again = measure(*inputs[case], args.repeat)
+                if again['relative_time'] < results[case]['relative_time']:
+                    results[case] = again
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        cases = dict(baseline.get('cases', {}), **results)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({'parser': HTML_PARSER, 'python': platform.python_version(), 'cases': cases}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline updated: {BASELINE_PATH}')
+        return 0
+
+    if baseline.get('parser') and baseline['parser'] != HTML_PARSER:
+        print(f"Note: the baseline was recorded with the {baseline['parser']} parser, this run uses {HTML_PARSER}")
+
+    regressions = find_regressions(results, baseline, args.speed_tolerance, args.memory_tolerance, args.min_slowdown_ms / 1000)
+    if regressions:
+        print('Regressions against the baseline:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+
+    print('No regressions against the baseline')
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        STATE_DIRECTORY.cleanup()
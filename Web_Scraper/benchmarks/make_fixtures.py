@@ -0,0 +1,158 @@
+# make_fixtures.py rebuilds the benchmark fixture pages from a day of recorded output
+#
+# The fixtures mirror the markup each scraper reads (ZipRecruiter js_variables, Indeed mosaic-data,
+# CareerBuilder listing cards and the Dice search API JSON) and are filled with the values of a real
+# scraped day, so the parsers do the same work they do on live pages. Run from Web_Scraper/:
+#     python benchmarks/make_fixtures.py [output/<day>]
+
+import os
+import re
+import sys
+import json
+import html
+import pandas as pd
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, 'fixtures')
+DEFAULT_DAY = os.path.join(BENCHMARK_DIRECTORY, '..', 'output', '2024-02-02')
+
+# Jobs per fixture page, about what one live results page holds
+PAGE_SIZES = {'ZipRecruiter': 20, 'Indeed': 15, 'CareerBuilder': 25, 'Dice': 100}
+
+
+def read_output(day, filename, rows):
+    frame = pd.read_csv(os.path.join(day, filename), dtype=str, keep_default_na=False)
+    return frame.head(rows).to_dict('records')
+
+
+# Navigation, footer and inline assets live pages carry around the data we extract
+def page_chrome(blocks=1200):
+    items = ''.join(
+        f'<div class="nav-item item-{i}"><a href="/browse/{i}" data-track="nav-{i}">Browse category {i}</a>'
+        f'<span class="count">{i * 7 % 500}</span></div>'
+        for i in range(blocks)
+    )
+    script = '<script>' + ''.join(f'window.__c{i}=function(a,b){{return a+b*{i};}};' for i in range(1500)) + '</script>'
+    style = '<style>' + ''.join(f'.c{i}{{margin:{i % 9}px;color:#{i % 999:03d}}}' for i in range(1500)) + '</style>'
+    return items, script + style
+
+
+def wrap_page(head, body):
+    chrome, assets = page_chrome()
+    return f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Jobs</title>{assets}{head}</head><body><nav>{chrome[:len(chrome) // 2]}</nav>{body}<footer>{chrome[len(chrome) // 2:]}</footer></body></html>'
+
+
+def zip_page(rows):
+    jobs = []
+    for row in rows:
+        company = re.sub(r'\s+', '+', row['Company'])
+        jobs.append({
+            'Title': row['Title'],
+            'City': row['City'],
+            'FormattedSalaryShort': row['Salary'] or None,
+            'EmploymentType': row['EmploymentType'],
+            'EmploymentTags': {'remote': row['RemoteStatus'] == 'remote'},
+            'JobURL': row['JobURL'],
+            'SaveJobURL': f"https://www.ziprecruiter.com/candidate/save?company={company}&posted_time={row['Posted_date']}&jid={row['JobID']}",
+            'OrgName': row['Company'],
+            'ShortDescription': f"{row['Title']} contract role in {row['City']}. " * 8,
+        })
+    head = '<script type="application/json" id="js_variables">' + json.dumps({'jobList': jobs, 'page': 1, 'totalJobs': 1234}) + '</script>'
+    body = f'<div class="job_results_headline"><h1 class="headline">1,234 {html.escape(rows[0]["Title"])} Jobs</h1></div>'
+    body += ''.join(f'<article class="job_result"><h2>{html.escape(job["Title"])}</h2><p>{html.escape(job["ShortDescription"])}</p></article>' for job in jobs)
+    return wrap_page(head, body)
+
+
+def indeed_salary(text):
+    match = re.match(r'\$([\d,.]+) - \$([\d,.]+) a (\w+)', text or '')
+    if not match:
+        return None
+    low, high = (float(value.replace(',', '')) for value in match.groups()[:2])
+    return {'min': low if low else high, 'max': high, 'type': match.group(3).upper()}
+
+
+def indeed_page(rows):
+    results = []
+    for row in rows:
+        results.append({
+            'company': row['Company'],
+            'formattedLocation': row['Location'],
+            'remoteLocation': row['Remote / Hybrid'] == 'Remote',
+            'extractedSalary': indeed_salary(row['Salary']),
+            'estimatedSalary': None,
+            'jobkey': row['Job ID'],
+            'pubDate': 1706832000000,
+            'taxonomyAttributes': [
+                {'label': 'remote', 'attributes': []},
+                {'label': 'job-types', 'attributes': [{'label': row['Job Type'], 'suid': 'NJXCK'}]},
+            ],
+            'viewJobLink': row['Job Link'].replace('https://www.indeed.com', ''),
+            'title': row['Title'],
+            'snippet': f"<ul><li>{row['Title']} supporting reporting and analytics.</li></ul>" * 4,
+        })
+    data = {'metaData': {'mosaicProviderJobCardsModel': {'results': results, 'pageNumber': 1}}}
+    head = (
+        '<script id="mosaic-data" type="text/javascript">'
+        'window.mosaic.providerData["mosaic-provider-tracking"]={};'
+        f'window.mosaic.providerData["mosaic-provider-jobcards"]={json.dumps(data)};'
+        'window.mosaic.providerData["mosaic-provider-rich-media"]={};</script>'
+    )
+    body = ''.join(f'<div class="job_seen_beacon"><h2>{html.escape(row["Title"])}</h2></div>' for row in rows)
+    return wrap_page(head, body)
+
+
+def careerbuilder_page(rows):
+    cards = []
+    for row in rows:
+        job_path = row['Job_url'].replace('https://www.careerbuilder.com', '')
+        cards.append(
+            '<li class="data-results-content-parent relative bg-shadow">'
+            f'<a class="data-results-content block job-listing-item" href="{html.escape(job_path)}">'
+            '<div class="data-results-top"><div class="data-results-publish-time">Today</div>'
+            f'<div class="data-results-title dark-blue-text b">{html.escape(row["Title"])}</div></div>'
+            f'<div class="data-details"><span>{html.escape(row["Company"])}</span><span>{html.escape(row["Location"])}</span>'
+            f'<span>{html.escape(row["Job_type"])}</span></div>'
+            '<div class="block show-mobile">Apply on company site</div>'
+            f'<div class="block">{html.escape(row["Salary"])}</div></a></li>'
+        )
+    body = '<div class="collapsed-activated"><ol class="data-results">' + ''.join(cards) + '</ol></div>'
+    return wrap_page('', body)
+
+
+def dice_response(rows):
+    data = []
+    for row in rows:
+        data.append({
+            'id': row['Job_id'],
+            'title': row['Job title'],
+            'postedDate': row['Job posting date'],
+            'modifiedDate': row['Modified Date'],
+            'detailsPageUrl': row['Job posting url'],
+            'jobLocation': {'displayName': row['Job location']},
+            'salary': row['Pay rate'],
+            'companyName': row['Vendor company name'],
+            'employmentType': row['Job type'],
+            'workFromHomeAvailability': row['Work from availability'],
+            'isRemote': row['Work type(remote/on-site)'] == 'Remote',
+            'summary': f"{row['Job title']} needed for a long term contract. " * 6,
+            'score': 0.5,
+        })
+    return {'data': data, 'meta': {'currentPage': 1, 'pageCount': 13, 'pageSize': 100, 'totalResults': 1287}}
+
+
+def main(day=DEFAULT_DAY):
+    os.makedirs(FIXTURE_DIRECTORY, exist_ok=True)
+    fixtures = {
+        'zip_js_variables.html': zip_page(read_output(day, 'output_ZipRecruiter.csv', PAGE_SIZES['ZipRecruiter'])),
+        'indeed_mosaic_data.html': indeed_page(read_output(day, 'output_Indeed.csv', PAGE_SIZES['Indeed'])),
+        'careerbuilder_listing.html': careerbuilder_page(read_output(day, 'output_CareerBuilder.csv', PAGE_SIZES['CareerBuilder'])),
+        'dice_search.json': json.dumps(dice_response(read_output(day, 'output_Dice.csv', PAGE_SIZES['Dice']))),
+    }
+    for name, content in fixtures.items():
+        with open(os.path.join(FIXTURE_DIRECTORY, name), 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        print(f'Wrote {name} ({len(content) // 1024} KB)')
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,179 @@
+# proxy_standins.py checks the proxy pool against local stand-in proxies, no network needed
+#
+# A local page server plays the portal and each stand-in is a small forward proxy with its own latency, capacity
+# (requests it serves at once), connection failure rate and block (403) rate. Two scenarios are run through the
+# shared HttpClient:
+#     scaling    the same load over 1 and over 3 identical proxies, throughput should grow with the proxies
+#     health     a fast, a slow, a flaky and a blocked proxy, the fast one should carry most of the requests
+# Run from Web_Scraper/:
+#     python benchmarks/proxy_standins.py
+#     python benchmarks/proxy_standins.py --requests 400 --threads 16
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import urllib.request
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIRECTORY))
+
+from config import Config
+
+PORTAL = 'Standin'
+
+# Keep the checks fast and away from the real cache, limits and circuit breaker
+Config.cache_mode = 'off'
+Config.rate_limit_start = Config.rate_limit_max = 1000.0
+Config.rate_limit_burst = 1000
+Config.retry_base_delay = Config.retry_max_delay = 0.01
+Config.circuit_failure_threshold = 10 ** 6
+Config.proxy_cooldown_seconds = 0.5
+Config.proxy_max_cooldown_seconds = 2
+
+import proxy_pool
+import requests
+
+from http_client import HttpClient
+
+# The stand-ins reach the page server directly, whatever proxy the environment sets
+DIRECT = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'<html><body>' + b'job ' * 500 + b'</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandinProxy:
+    # A forward proxy for plain http urls: waits latency seconds, then drops the connection, answers 403 or
+    # forwards the request to the page server
+    def __init__(self, name, latency=0.05, capacity=2, failure_rate=0.0, block_rate=0.0):
+        self.name = name
+        self.served = 0
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(capacity)
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with standin.slots:
+                    with standin.lock:
+                        standin.served += 1
+                    time.sleep(latency)
+                    if random.random() < failure_rate:
+                        self.close_connection = True
+                        return
+                    if random.random() < block_rate:
+                        body = b'<html>Access Denied</html>'
+                        self.send_response(403)
+                    else:
+                        with DIRECT.open(self.path) as response:
+                            body = response.read()
+                        self.send_response(200)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = start_server(Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Send requests through a fresh pool of the stand-ins, returns (seconds, failed requests)
+def run_load(standins, page_url, count, threads):
+    Config.proxies = [standin.url for standin in standins]
+    Config.portal_concurrency = {PORTAL: threads}
+    proxy_pool._pool = None
+    client = HttpClient()
+
+    def fetch(_):
+        try:
+            return client.get(page_url, portal=PORTAL).status_code == 200
+        except requests.RequestException:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(fetch, range(count)))
+    client.close()
+    return time.perf_counter() - start, results.count(False)
+
+
+def scaling(page_url, count, threads):
+    print('Scaling: identical proxies (50ms, 2 requests at a time each)')
+    rates = []
+    for proxies in (1, 3):
+        standins = [StandinProxy(f'proxy-{index}') for index in range(proxies)]
+        seconds, failed = run_load(standins, page_url, count, threads)
+        rates.append(count / seconds)
+        print(f'  {proxies} proxies: {count / seconds:7.1f} requests/sec, {failed} failed, '
+              f'served {[standin.served for standin in standins]}')
+    return rates[1] > rates[0] * 1.5
+
+
+def health(page_url, count, threads):
+    print('Health: requests served by each proxy')
+    standins = [
+        StandinProxy('fast', latency=0.02, capacity=4),
+        StandinProxy('slow', latency=0.4, capacity=4),
+        StandinProxy('flaky', latency=0.02, capacity=4, failure_rate=0.4),
+        StandinProxy('blocked', latency=0.02, capacity=4, block_rate=0.6),
+    ]
+    seconds, failed = run_load(standins, page_url, count, threads)
+    for standin in standins:
+        print(f'  {standin.name:<8} {standin.served:>5} requests')
+    print(f'  {count} requests in {seconds:.2f}s, {failed} failed')
+
+    snapshot = proxy_pool.get_pool().snapshot()
+    for standin in standins:
+        stats = snapshot.get(standin.url, {})
+        portal_stats = stats.get('portals', {}).get(PORTAL, {})
+        print(f"  {standin.name:<8} latency {stats.get('latency')} success {portal_stats.get('success_rate')} "
+              f"blocks {portal_stats.get('block_rate')}")
+    return max(standins, key=lambda standin: standin.served).name == 'fast'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the proxy pool against local stand-in proxies')
+    parser.add_argument('--requests', type=int, default=200, help='requests per load')
+    parser.add_argument('--threads', type=int, default=8, help='requests in flight at once')
+    args = parser.parse_args()
+
+    page_server = start_server(PageHandler)
+    page_url = f'http://127.0.0.1:{page_server.server_address[1]}/jobs'
+
+    checks = {
+        'more proxies give more throughput': scaling(page_url, args.requests, args.threads),
+        'the healthiest proxy carries the most requests': health(page_url, args.requests, args.threads),
+    }
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,97 +1,87 @@
-import re
-import os
-import time
-import json
-import random
 import warnings
 import requests
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
 from config import Config
-from datetime import datetime, timedelta
+from http_client import get_client
+from resilience import get_guard
+from metrics import get_metrics
+from parsing import make_soup
+from seen_index import SeenIndex
+from checkpoint import run_units
+from normalize import relative_dates
+from run_clock import get_clock
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
 class CareerBuilderScraper:
-    def __init__(self):
-        # Randomly select a user-agent
-        self.user_agent = random.choice(Config.USER_AGENT_LIST)
-        self.headers = {'User-Agent': self.user_agent}
-        self.proxy = Config.proxy
-        self.proxies = {"http": self.proxy, "https": self.proxy}
-
-    # Function to categorize work type based on title
-    def categorize_work_type(self, title):
-        if 'Onsite' in title:
-            return 'On-site'
-        elif 'Hybrid' in title:
-            return 'Hybrid'
-        elif 'Remote' in title:
-            return 'Remote'
-        else:
-            return None
+    portal = "CareerBuilder"
+    # Rows left out of the output and the column that identifies a job
+    output_exclude = None
+    id_column = 'Job_id'
+    # Search pages fetched per keyword
+    page_count = 20
 
-    # Function to convert relative dates to actual dates
-    def convert_relative_dates(self, relative_date):
+    def __init__(self):
+        # Shared pooled client, rotates the user-agent and routes through the proxy
+        self.client = get_client()
+        self.max_workers = Config.portal_concurrency["CareerBuilder"]
+        self.seen_index = SeenIndex("CareerBuilder")
+
+    # Function to categorize the work type of a whole column of locations at once: On-site, Hybrid or Remote
+    def categorize_work_types(self, locations):
+        locations = locations.fillna('')
+        conditions = [
+            locations.str.contains('Onsite', regex=False),
+            locations.str.contains('Hybrid', regex=False),
+            locations.str.contains('Remote', regex=False),
+        ]
+        return pd.Series(np.select(conditions, ['On-site', 'Hybrid', 'Remote'], default=None), index=locations.index)
+
+    # Function to convert a column of relative dates to actual dates, counted back from the day of the run
+    def convert_relative_dates(self, relative_dates_column):
+        return relative_dates(relative_dates_column, get_clock().today())
+
+    # Function to extract one job from its listing element, returns None if a field is missing
+    def parse_listing(self, inner_listing):
         try:
-            if 'today' in relative_date or 'Today' in relative_date:
-                return datetime.now().date()
-            elif 'yesterday' in relative_date or '1 day ago' in relative_date:
-                return (datetime.now() - timedelta(days=1)).date()
-            elif 'days ago' in relative_date:
-                days_ago = int(relative_date.split()[0])
-                return (datetime.now() - timedelta(days=days_ago)).date()
-            else:
-                return None
-        except Exception as e:
+            details = inner_listing.find('div', class_='data-details').find_all('span')
+            job_url = inner_listing.find('a', class_='data-results-content')['href']
+            result = inner_listing.select('div.block:not(.show-mobile)')
+
+            return {
+                'publish_time': inner_listing.find('div', class_='data-results-publish-time').text.strip(),
+                'title': inner_listing.find('div', class_='data-results-title').text.strip(),
+                'company': details[0].text.strip(),
+                'location': details[1].text.strip(),
+                'employment_type': details[2].text.strip(),
+                'url': f"https://www.careerbuilder.com{job_url}",
+                'result': result[0].get_text(strip=True),
+            }
+        except Exception:
             return None
 
     # Function to get data from the soup object
     def get_data(self, soup):
         try:
-            # Extracting job listings using different classes
-            job_listings = soup.find_all('div', class_='collapsed-activated')
-            all_dataframes = []
-
-            for listing in job_listings:
-                listing_soup = BeautifulSoup(str(listing), 'html.parser')
-                inner_listings = listing_soup.find_all('li', class_='data-results-content-parent relative bg-shadow')
-
-                inner_dataframes = []
-
-                for inner_listing in inner_listings:
-                    job_data = {}
-                    inner_soup = BeautifulSoup(str(inner_listing), 'html.parser')
-
-                    try:
-                        # Extracting data from the inner listing
-                        job_data['publish_time'] = inner_soup.find('div', class_='data-results-publish-time').text.strip()
-                        job_data['title'] = inner_soup.find('div', class_='data-results-title').text.strip()
-                        job_data['company'] = inner_soup.find('div', class_='data-details').find('span').text.strip()
-                        job_data['location'] = inner_soup.find('div', class_='data-details').find_all('span')[1].text.strip()
-                        job_data['employment_type'] = inner_soup.find('div', class_='data-details').find_all('span')[2].text.strip()
-                        job_url = inner_listing.find('a', class_='data-results-content')['href']
-                        job_data['url'] = f"https://www.careerbuilder.com{job_url}"
-                        result = inner_soup.select('div.block:not(.show-mobile)')
-                        job_data['result'] = result[0].get_text(strip=True)
-
-                        inner_dataframes.append(pd.DataFrame([job_data]))
-
-                    except Exception as e:
-                        continue
-
-                try:
-                    combined_dataframe = pd.concat(inner_dataframes, ignore_index=True)
-                    all_dataframes.append(combined_dataframe)
-                except Exception as e:
-                    continue
-
-            final_dataframe = pd.concat(all_dataframes, ignore_index=True)
-            final_dataframe['Work Location'] = final_dataframe['location'].apply(self.categorize_work_type)
-            final_dataframe['Date Posted'] = final_dataframe['publish_time'].apply(self.convert_relative_dates)
-            final_dataframe['Current Date'] = datetime.now().date()
+            # Walk the listings in place instead of re-parsing each fragment
+            job_records = []
+
+            for listing in soup.find_all('div', class_='collapsed-activated'):
+                for inner_listing in listing.find_all('li', class_='data-results-content-parent relative bg-shadow'):
+                    job_data = self.parse_listing(inner_listing)
+                    if job_data is not None:
+                        job_records.append(job_data)
+
+            # A page past the last one lists no jobs
+            if not job_records:
+                return pd.DataFrame()
+
+            final_dataframe = pd.DataFrame(job_records)
+            final_dataframe['Work Location'] = self.categorize_work_types(final_dataframe['location'])
+            final_dataframe['Date Posted'] = self.convert_relative_dates(final_dataframe['publish_time'])
+            final_dataframe['Current Date'] = get_clock().today()
 
             # Column mapping
             columns_mapping = {
@@ -111,73 +101,46 @@ class CareerBuilderScraper:
 
             return final_dataframe
 
-        except Exception as e:
+        except Exception:
             return None
 
-    # Function to run the CareerBuilder scraper
+    # Function to list the pages every keyword starts from
+    def first_pages(self):
+        return [0]
+
+    # Function to scrape one (keyword, page) unit on its own. Pages are walked one after the other like in run(),
+    # each page leads to the next unless it holds only known jobs in incremental mode
+    def scrape_page(self, keyword, u):
+        url = Config.url_career.format(keyword=keyword.lower().replace(" ", "%20"), page=u)
+        next_pages = [u + 1] if u + 1 < self.page_count else []
+
+        with get_metrics().page("CareerBuilder", keyword, u):
+            try:
+                response = self.client.get(url, portal="CareerBuilder")
+                response.raise_for_status()
+                with get_metrics().stage('parse'):
+                    soup = make_soup(response.content)
+                with get_metrics().stage('transform'):
+                    result_df = self.get_data(soup)
+            except requests.RequestException as e:
+                print(f'Request error for page {u}: {e}')
+                # A blocked portal ends the walk, other failures move on to the next page
+                return None, [] if get_guard("CareerBuilder").is_open() else next_pages
+            except Exception as e:
+                print(f'Error for page {u}: {e}')
+                return None, next_pages
+
+        if result_df is not None and result_df.empty:
+            print(f'No jobs on page {u} for {keyword}, it was the last one')
+            next_pages = []
+        elif result_df is not None and Config.incremental and self.seen_index.all_seen(result_df['Job_id']):
+            print(f'All jobs on page {u} for {keyword} were already scraped, moving on')
+            next_pages = []
+        return result_df, next_pages
+
+    # Function to run the CareerBuilder scraper, resuming from the checkpoint of an interrupted run
     def run(self):
-        # Define the output file path based on the config
-        output_directory = Config.output_directory
-        output_subdirectory = Config.subdirectory
-        output_filename = Config.output_csv_career
-        output_path = os.path.join(output_directory, output_subdirectory)
-        output_file_path = os.path.join(output_path, output_filename)
-
-        # Initialize lists to store data and soup objects
-        dataframes = []
-        soups = []
-
-        # Create a session to reuse the same connection
-        session = requests.Session()
-
-        try:
-            for keyword in Config.keywords:
-                keyword_lower = keyword.lower()
-
-                for u in range(0, 20):
-                    url = Config.url_career.format(keyword=keyword_lower.replace(" ", "%20"), page=u)
-
-                    try:
-                        response = session.get(url, headers=self.headers, proxies=self.proxies, verify=False)
-                        response.raise_for_status()
-
-                        if response.status_code == 200:
-                            print('Success!')
-                        else:
-                            print('Sorry, your connection is blocked by the website')
-                            continue
-
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        soups.append(soup)
-                        result_df = self.get_data(soup)
-
-                        if result_df is None or result_df.empty:
-                            print('Sorry, but the bot did not find proper data on this page')
-                            continue
-
-                        dataframes.append(result_df)
-                        print(f'Success for the page: {u}')
-
-                    except requests.RequestException as e:
-                        print(f'Request error for page {u}: {e}')
-
-                    except Exception as e:
-                        print(f'Error for page {u}: {e}')
-
-                    time.sleep(5)
-
-        except Exception as e:
-            print(f'An unexpected error occurred: {e}')
-
-        # Concatenate dataframes
-        final_dataframe = pd.concat(dataframes, ignore_index=True)
-        final_dataframe.drop_duplicates(inplace=True)
-
-        # Save the data to the specified file path
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        final_dataframe.to_csv(output_file_path, index=False)
+        run_units(self)
 
 if __name__ == "__main__":
     career_builder_scraper = CareerBuilderScraper()
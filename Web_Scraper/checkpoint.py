@@ -0,0 +1,183 @@
+# checkpoint.py per-run manifest of finished (portal, keyword, page) units so an interrupted run resumes where it stopped
+
+import os
+import re
+import json
+import threading
+
+from config import Config
+from collections import deque
+from metrics import get_metrics, profile_call
+from resilience import get_guard
+from output_writer import StreamingWriter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Raised when a run ends with pages that failed or were skipped, its checkpoint is kept for the next attempt
+class IncompleteRun(Exception):
+    pass
+
+
+# File name of a unit's rows, keywords are reduced to safe characters
+def unit_filename(keyword, page):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', keyword).strip('_')
+    return f'{slug}-{page:05d}.csv'
+
+
+class Checkpoint:
+    # Each finished unit is appended to <checkpoint_directory>/<run>/<portal>.jsonl once its rows are on disk,
+    # so a unit is either in the manifest with its part file or gets scraped again
+    def __init__(self, portal, run_id=None):
+        self.portal = portal
+        self.run_id = run_id or Config.subdirectory
+        directory = os.path.join(Config.checkpoint_directory, self.run_id)
+        self.manifest_path = os.path.join(directory, f'{portal}.jsonl')
+        self.writer = StreamingWriter(portal, os.path.join(directory, portal))
+        self.lock = threading.Lock()
+
+        if not Config.resume and os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.attempts = 0
+        self.units = self.load()
+        for entry in self.units.values():
+            if entry['path']:
+                self.writer.add_part(entry['path'])
+        if self.units:
+            print(f'Resuming {portal}: {len(self.units)} pages were finished by an earlier attempt of run {self.run_id}')
+
+    # Read the manifest, a line cut short by a crash or a unit whose rows went missing is scraped again.
+    # Lines without a keyword count the earlier attempts that ended with pages left over
+    def load(self):
+        units = {}
+        if not os.path.exists(self.manifest_path):
+            return units
+        with open(self.manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'incomplete' in entry:
+                    self.attempts += 1
+                elif entry['path'] is None or os.path.exists(entry['path']):
+                    units[(entry['keyword'], entry['page'])] = entry
+        return units
+
+    def finished(self, keyword, page):
+        return self.units.get((keyword, page))
+
+    # Save a unit's rows and then append it to the manifest
+    def record(self, keyword, page, dataframe, next_pages):
+        with get_metrics().page(self.portal, keyword, page):
+            path = self.writer.write(dataframe, unit_filename(keyword, page))
+        entry = {'keyword': keyword, 'page': page, 'rows': 0 if path is None else len(dataframe), 'path': path, 'next_pages': list(next_pages)}
+
+        with self.lock:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.units[(keyword, page)] = entry
+
+    # Note in the manifest that an attempt ended with units left over, the finished ones stay for the next attempt
+    def suspend(self, incomplete):
+        entry = {'incomplete': [list(unit) for unit in incomplete]}
+        with self.lock:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.attempts += 1
+
+    # Write the day's output from every unit and drop the checkpoint, returns the written IDs. With keep the
+    # manifest and parts stay, so a later attempt adds the units that are missing and writes the output again
+    def finalize(self, exclude=None, id_column=None, keep=False):
+        job_ids = self.writer.finalize(exclude=exclude, id_column=id_column, keep_parts=keep)
+        if keep:
+            return job_ids
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        # The run folder goes once its last portal finished
+        try:
+            os.rmdir(os.path.dirname(self.manifest_path))
+        except OSError:
+            pass
+        return job_ids
+
+
+# Scrape every (keyword, page) unit of a portal with its scrape_page(), max_workers at a time. Each page a unit
+# leads to is scheduled as it finishes, units a previous attempt of the run finished are skipped. When units fail
+# or are skipped the output is written from the finished units, the checkpoint is kept and IncompleteRun raised,
+# so the next attempt only scrapes what is left. After Config.checkpoint_max_attempts such attempts the checkpoint
+# is dropped and the partial output stands
+def run_units(scraper, keywords=None):
+    keywords = keywords or Config.keywords
+    checkpoint = Checkpoint(scraper.portal)
+    guard = get_guard(scraper.portal)
+    pending = deque((keyword, page) for keyword in keywords for page in scraper.first_pages())
+    scheduled = set()
+    incomplete = []
+    futures = {}
+
+    with ThreadPoolExecutor(max_workers=scraper.max_workers) as executor:
+        while pending or futures:
+            while pending:
+                unit = pending.popleft()
+                if unit in scheduled:
+                    continue
+                scheduled.add(unit)
+
+                entry = checkpoint.finished(*unit)
+                if entry is not None:
+                    pending.extend((unit[0], page) for page in entry['next_pages'])
+                elif guard.is_open():
+                    print(f'{scraper.portal} keeps blocking us, skipping {unit[0]} page {unit[1]}')
+                    incomplete.append(unit)
+                else:
+                    futures[executor.submit(profile_call, scraper.portal, scraper.scrape_page, *unit)] = unit
+
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                keyword, page = futures.pop(future)
+                try:
+                    dataframe, next_pages = future.result()
+                except Exception as e:
+                    print(f'Sorry, {scraper.portal} page {page} for {keyword} failed: {e}')
+                    incomplete.append((keyword, page))
+                    continue
+
+                # A page that brought no frame at all failed to fetch or parse, leave it for the next attempt.
+                # A page without jobs brings an empty frame and counts as finished
+                if dataframe is None:
+                    incomplete.append((keyword, page))
+                else:
+                    checkpoint.record(keyword, page, dataframe, next_pages)
+                pending.extend((keyword, next_page) for next_page in next_pages)
+
+    resume = False
+    if incomplete:
+        checkpoint.suspend(incomplete)
+        resume = checkpoint.attempts < Config.checkpoint_max_attempts
+        if not resume:
+            print(f'{scraper.portal} still has {len(incomplete)} pages left after {checkpoint.attempts} attempts, '
+                  f'giving up on them')
+
+    job_ids = checkpoint.finalize(exclude=scraper.output_exclude, id_column=scraper.id_column, keep=resume)
+    scraper.seen_index.mark(job_ids)
+    # A delta of a partial output would report the missing pages' jobs as removed, it waits for the full output
+    # Imported here so a run without them does not load their dependencies (bs4 for the enrichment)
+    if Config.write_delta and not resume:
+        from delta import write_delta
+        write_delta(scraper.portal)
+    if Config.enrich_details:
+        from enrichment import enrich_portal
+        enrich_portal(scraper.portal)
+    if resume:
+        raise IncompleteRun(f'{len(incomplete)} {scraper.portal} pages failed or were skipped, the output holds the '
+                            f'{len(checkpoint.units)} finished pages and the next attempt scrapes the rest')
+    return job_ids
@@ -3,6 +3,8 @@ from datetime import datetime
 class Config:
     # Proxy settings
     proxy = "http://5cbf8735d2a8b5fd3bc1d1a0585481903fbfd21c:@proxy.zenrows.com:8001"
+    # Proxy endpoints requests are spread over by health (proxy_pool.py), add more exits here
+    proxies = [proxy]
     
      # URL's for Job Portals
     url_zip = "https://www.ziprecruiter.com/jobs-search"
@@ -30,16 +32,171 @@ class Config:
     output_csv_indeed = "output_Indeed.csv"
     output_csv_dice = "output_Dice.csv"
     output_csv_career = "output_CareerBuilder.csv"
+    portal_output_files = {
+        "ZipRecruiter": output_csv_zip,
+        "Indeed": output_csv_indeed,
+        "CareerBuilder": output_csv_career,
+        "Dice": output_csv_dice,
+    }
     
     # Search type for Dice job search API
     search_type = "1"
     
+    # Dice results per API page and the most pages fetched per keyword
+    dice_page_size = 100
+    dice_max_pages = 10
+    
     # Output directory settings
     output_directory = "output"
     subdirectory = datetime.now().strftime('%Y-%m-%d')
     output_csv_path1 = f"output/{datetime.now().strftime('%Y-%m-%d')}"
     output_csv_path2 = f"{output_directory}/{subdirectory}"
     
+    # Point the day folder and output paths at the day of a run, a long-lived process calls this for every run
+    # instead of writing into the day it was started on
+    @classmethod
+    def set_run_day(cls, day):
+        cls.subdirectory = day
+        cls.output_csv_path1 = f"{cls.output_directory}/{day}"
+        cls.output_csv_path2 = f"{cls.output_directory}/{day}"
+    
+    # Output formats to write ("csv" and/or "parquet"), Parquet is partitioned by portal and date
+    output_formats = ["csv"]
+    parquet_directory = f"{output_directory}/parquet"
+    parquet_compression = "zstd"
+    
+    # Scratch folder for the part files results are streamed into before the final output is written
+    streaming_directory = "state/parts"
+    
+    # HTTP connection pool and timeout settings (seconds)
+    http_pool_connections = 10
+    http_pool_maxsize = 10
+    connect_timeout = 10
+    read_timeout = 30
+    
+    # Adaptive per-host rate limiting (requests per second), backs off on throttle/block responses
+    rate_limit_start = 2.0
+    rate_limit_min = 0.1
+    rate_limit_max = 5.0
+    rate_limit_burst = 2
+    rate_limit_increase = 0.1
+    rate_limit_decrease = 0.5
+    rate_limit_max_pause = 60
+    rate_limit_hosts = {
+        "www.careerbuilder.com": 1.0,
+    }
+    throttle_status_codes = (403, 429, 503)
+    block_page_markers = ["px-captcha", "verify you are a human", "Access Denied", "unusual traffic", "Request unsuccessful"]
+    block_page_scan_bytes = 20000
+    
+    # Retries with jittered exponential backoff for timeouts, connection errors and these status codes
+    retry_attempts = 3
+    retry_base_delay = 1.0
+    retry_max_delay = 30.0
+    retry_status_codes = (429, 500, 502, 503, 504)
+    # Statuses that mean the portal refused us, like the block page markers these are not retried
+    block_status_codes = (403,)
+    
+    # Per-portal circuit breaker: after this many failed requests in a row the portal gets no requests for a while
+    circuit_failure_threshold = 3
+    circuit_open_seconds = 900
+    
+    # Adaptive concurrency: a portal's requests in flight are halved when the error rate of the recent window passes the threshold
+    concurrency_window = 20
+    concurrency_error_threshold = 0.2
+    
+    # On-disk response cache: "off", "on" (reuse fresh pages) or "replay" (only serve recorded pages, no network)
+    cache_mode = "off"
+    cache_directory = "cache/http"
+    cache_max_bytes = 2 * 1024 ** 3
+    cache_default_ttl = 6 * 3600
+    cache_ttl = {
+        "ZipRecruiter": 6 * 3600,
+        "Indeed": 6 * 3600,
+        "CareerBuilder": 6 * 3600,
+        "Dice": 2 * 3600,
+    }
+    
+    # Maximum number of requests each portal may have in flight at once
+    portal_concurrency = {
+        "ZipRecruiter": 3,
+        "Indeed": 4,
+        "CareerBuilder": 1,
+        "Dice": 4,
+    }
+    
+    # Preferred HTML parser backend, html.parser is used when it is not installed
+    html_parser = "lxml"
+    
+    # Seen job index, in incremental mode a keyword stops paginating once a page holds only known jobs
+    incremental = False
+    seen_index_directory = "state"
+    seen_index_capacity = 2000000
+    seen_index_error_rate = 0.01
+    
+    # Cross-portal duplicate detection (MinHash signature size, LSH bands and the title similarity to merge at)
+    dedupe_num_perm = 64
+    dedupe_bands = 16
+    dedupe_threshold = 0.6
+    output_csv_clusters = "job_clusters.csv"
+    
+    # Canonical jobs with numeric pay, pay unit and UTC posted time, written per day folder by job_record.py
+    output_csv_normalized = "jobs_normalized.csv"
+    
+    # History store that every day's outputs are loaded into for searching
+    history_db_path = "state/history.sqlite"
+    history_batch_size = 5000
+    
+    # Run report (JSON per run plus a Prometheus textfile for the node exporter textfile collector)
+    metrics_directory = "state/metrics"
+    metrics_textfile = "state/metrics/job_scraper.prom"
+    # Deep-dive profiling: None, "cprofile" (a .prof file per portal) or "tracemalloc" (top allocation sites)
+    profile_mode = None
+
+    # Work queue that spreads a run's (portal, keyword, page) tasks over worker processes or hosts (work_queue.py)
+    queue_path = "state/queue.sqlite"
+    queue_results_directory = "state/queue_results"
+    # WAL is fastest on a local disk, use "DELETE" when the queue sits on a network share used by several hosts
+    queue_journal_mode = "WAL"
+    queue_lease_seconds = 120
+    queue_heartbeat_seconds = 30
+    queue_max_attempts = 3
+    queue_poll_seconds = 5
+
+    # Checkpoint of finished (portal, keyword, page) units, a run started again the same day skips them
+    checkpoint_directory = "state/checkpoints"
+    resume = True
+    # Attempts of a run that may end with failed pages before its output is written without them
+    checkpoint_max_attempts = 3
+
+    # Proxy health scoring: latency, success and block rates are moving averages with this weight for the newest request.
+    # A failing proxy cools down for proxy_cooldown_seconds, doubled with every failure in a row up to the maximum
+    proxy_score_alpha = 0.2
+    proxy_cooldown_seconds = 30
+    proxy_max_cooldown_seconds = 600
+    # Latency assumed for a proxy that has not answered yet
+    proxy_default_latency = 1.0
+    
+    # Optional detail page enrichment (enrichment.py): description, skills and contract duration of every new job,
+    # stored by portal job ID so a job is fetched only once, and written per day to details_<portal>.csv
+    enrich_details = False
+    enrichment_db_path = "state/enrichment.sqlite"
+    enrichment_batch_size = 50
+    output_csv_details = "details_{portal}.csv"
+    enrichment_skills = [
+        "SQL", "Python", "Excel", "Tableau", "Power BI", "SAS", "SPSS", "Looker", "Qlik", "Alteryx", "VBA", "DAX",
+        "Snowflake", "Redshift", "BigQuery", "Databricks", "Spark", "Hadoop", "Hive", "Airflow", "dbt", "ETL", "SSIS", "SSRS",
+        "Oracle", "SQL Server", "PostgreSQL", "MySQL", "MongoDB", "AWS", "Azure", "GCP", "Java", "Scala", "C#", "JavaScript",
+        "Salesforce", "SAP", "Workday", "ServiceNow", "JIRA", "Confluence", "Agile", "Scrum", "Machine Learning", "Statistics",
+    ]
+    
+    # Daily delta (delta.py): each portal's new, changed and removed rows against the previous day folder. They go
+    # to <delta_directory>/<day>/, away from the day folders whose CSVs are the portal outputs
+    write_delta = True
+    delta_directory = f"{output_directory}/delta"
+    output_csv_delta = "delta_{portal}.csv"
+    output_delta_summary = "delta_summary.json"
+    
     # Keywords for job search
     keywords = ["Data Analyst"]
     # , "Business Analyst", "System Analyst", "Data Scientists", "Data engineer", "Business System Analyst"]
\ No newline at end of file
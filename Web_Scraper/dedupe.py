@@ -0,0 +1,146 @@
+# dedupe.py cross-portal duplicate detection for the Job Portals
+
+import os
+import re
+import sys
+import zlib
+import hashlib
+import numpy as np
+
+from config import Config
+from job_record import load_outputs
+
+COMPANY_SUFFIXES = re.compile(r'\b(inc|llc|l l c|ltd|limited|corp|corporation|co|company|group|pvt|plc)\b')
+NON_WORD = re.compile(r'[^a-z0-9]+')
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+class DuplicateDetector:
+    def __init__(self, num_perm=None, bands=None, threshold=None, seed=1):
+        self.num_perm = num_perm or Config.dedupe_num_perm
+        self.bands = bands or Config.dedupe_bands
+        self.rows = self.num_perm // self.bands
+        self.threshold = threshold or Config.dedupe_threshold
+        generator = np.random.default_rng(seed)
+        self.a = generator.integers(1, MERSENNE_PRIME, self.num_perm, dtype=np.int64)
+        self.b = generator.integers(0, MERSENNE_PRIME, self.num_perm, dtype=np.int64)
+
+    # Lowercase, drop punctuation and collapse whitespace on a whole column
+    def normalize_text(self, column):
+        return column.astype('string').fillna('').str.lower().str.replace(NON_WORD, ' ', regex=True).str.strip()
+
+    def normalize(self, frame):
+        frame = frame.copy()
+        frame['norm_title'] = self.normalize_text(frame['title'])
+        frame['norm_company'] = self.normalize_text(frame['company']).str.replace(COMPANY_SUFFIXES, '', regex=True).str.split().str.join(' ')
+        # Only the city is comparable, Zip reports just the city and the others add state, zip or "(Onsite)"
+        frame['norm_city'] = self.normalize_text(frame['location'].astype('string').fillna('').str.split(',').str[0])
+        return frame
+
+    # Character 3-grams of a title hashed to 32 bit ints
+    def shingles(self, title):
+        padded = f' {title} '
+        return np.fromiter({zlib.crc32(padded[i:i + 3].encode('utf-8')) for i in range(max(1, len(padded) - 2))}, dtype=np.int64)
+
+    def minhash(self, title):
+        values = self.shingles(title)
+        return ((self.a[:, None] * values[None, :] + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def jaccard(self, signature_a, signature_b):
+        return float(np.mean(signature_a == signature_b))
+
+    # Give every row a cluster ID, rows in one cluster are the same posting on different boards or days
+    def cluster(self, frame):
+        frame = self.normalize(frame).reset_index(drop=True)
+        union_find = UnionFind(len(frame))
+
+        # Exact matches on the normalized fields are merged without any hashing
+        exact_key = frame['norm_title'] + '|' + frame['norm_company'] + '|' + frame['norm_city']
+        for indexes in frame.groupby(exact_key, sort=False).indices.values():
+            for index in indexes[1:]:
+                union_find.union(indexes[0], index)
+
+        # Near duplicates: only titles within the same company + city block that share an LSH band are compared
+        titles = frame['norm_title'].tolist()
+        blocks = list(zip(frame['norm_company'], frame['norm_city']))
+        representatives = sorted({union_find.find(index) for index in range(len(frame))})
+        signatures = {}
+        buckets = {}
+        for index in representatives:
+            signature = self.minhash(titles[index])
+            signatures[index] = signature
+            for band in range(self.bands):
+                band_key = (blocks[index], band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                buckets.setdefault(band_key, []).append(index)
+
+        compared = set()
+        for members in buckets.values():
+            for position, first in enumerate(members):
+                for other in members[position + 1:]:
+                    if (first, other) in compared:
+                        continue
+                    compared.add((first, other))
+                    if self.jaccard(signatures[first], signatures[other]) >= self.threshold:
+                        union_find.union(first, other)
+
+        roots = [union_find.find(index) for index in range(len(frame))]
+        frame['cluster_id'] = self.cluster_names(frame, roots)
+        return frame
+
+    # Name each cluster after its root row: the portal job ID, or its title, company, city and link when the
+    # row has no ID. A root whose name is taken already gets its key numbered, so clusters never share a name
+    def cluster_names(self, frame, roots):
+        job_ids = frame['job_id'].astype('string')
+        fallback = (frame['norm_title'] + '|' + frame['norm_company'] + '|' + frame['norm_city'] + '|'
+                    + frame['url'].astype('string').fillna(''))
+        keys = (frame['portal'].astype('string').fillna('') + ':' + job_ids.where(job_ids.notna(), '|' + fallback)).tolist()
+
+        names = {}
+        taken = set()
+        for root in sorted(set(roots)):
+            key, number = keys[root], 0
+            name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+            while name in taken:
+                number += 1
+                name = hashlib.sha1(f'{key}#{number}'.encode('utf-8')).hexdigest()[:12]
+            taken.add(name)
+            names[root] = name
+        return [names[root] for root in roots]
+
+
+# Cluster the given day folders (today's by default) and write the cluster IDs next to the newest one
+def main(directories=None):
+    directories = directories or [Config.output_csv_path1]
+    frame = load_outputs(directories)
+    if frame.empty:
+        print('No output files found to de-duplicate')
+        return None
+
+    clustered = DuplicateDetector().cluster(frame)
+    output_file = os.path.join(sorted(directories)[-1], Config.output_csv_clusters)
+    clustered[['day', 'portal', 'job_id', 'title', 'company', 'location', 'cluster_id']].to_csv(output_file, index=False)
+
+    cluster_sizes = clustered.groupby('cluster_id')['portal'].transform('size')
+    print(f'{len(clustered)} jobs, {clustered["cluster_id"].nunique()} distinct postings, '
+          f'{int((cluster_sizes > 1).sum())} jobs are duplicates of another posting')
+    return clustered
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
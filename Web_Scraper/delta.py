@@ -0,0 +1,184 @@
+# delta.py changes of each portal's output against the previous run, so downstream only ingests what changed
+#
+#     python delta.py                                   today's outputs against the latest earlier day folder
+#     python delta.py --day 2024-02-02 --previous 2024-01-31
+#
+# Rows are joined on the portal job ID and compared by a hash of their content, only two days are ever in memory.
+# When either day has no job IDs (older ZipRecruiter files) both are joined on the title, company and link columns
+# they have instead.
+# Config.delta_directory/<day>/delta_<portal>.csv holds the new, changed and removed rows and delta_summary.json
+# the counts of every portal
+
+import os
+import json
+import glob
+import argparse
+import threading
+import pandas as pd
+
+from config import Config
+from job_record import LEGACY_COLUMNS, PORTAL_FIELDS
+
+# Columns that differ between runs without the job changing: scrape times, the Indeed posted date (stamped with
+# the scrape time) and job link (carries a tracking token), the CareerBuilder posted date (worked out from
+# "n days ago" on the scrape day) and the Dice keyword a job was found with
+VOLATILE_COLUMNS = {
+    'ZipRecruiter': {'Current date time (CST)'},
+    'Indeed': {'Current Date Time', 'Date Posted', 'Job Link'},
+    'CareerBuilder': {'Current Date', 'Date Posted'},
+    'Dice': {'Current date time (CST)', 'Current date time', 'Job Title'},
+}
+
+# Canonical fields rows are joined on when a day has no job IDs
+FALLBACK_KEY_FIELDS = ('title', 'company', 'url')
+
+_summary_lock = threading.Lock()
+
+
+# Day folders that hold outputs, oldest first
+def day_directories():
+    return sorted(path for path in glob.glob(os.path.join(Config.output_directory, '*')) if os.path.isdir(path) and os.path.basename(path)[:1].isdigit())
+
+
+# Latest day folder before directory with an output of the portal, None on the first run
+def previous_directory(portal, directory):
+    day = os.path.basename(os.path.normpath(directory))
+    earlier = [path for path in day_directories() if os.path.basename(path) < day]
+    for path in reversed(earlier):
+        if os.path.exists(os.path.join(path, Config.portal_output_files[portal])):
+            return path
+    return None
+
+
+# A portal output with today's column names, None when the day has none
+def read_output(portal, directory):
+    if directory is None:
+        return None
+    path = os.path.join(directory, Config.portal_output_files[portal])
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype=str).rename(columns=LEGACY_COLUMNS.get(portal, {}))
+
+
+def has_ids(portal, frame):
+    id_column = PORTAL_FIELDS[portal]['job_id']
+    return id_column in frame.columns and frame[id_column].notna().any()
+
+
+# Index an output by job ID, rows without one cannot be joined and are left out. With key_columns given the
+# index is the values of those columns instead
+def keyed(portal, frame, key_columns=None):
+    if key_columns is None:
+        id_column = PORTAL_FIELDS[portal]['job_id']
+        frame = frame[frame[id_column].notna()].drop_duplicates(subset=id_column)
+        return frame.set_index(id_column)
+
+    keys = frame[key_columns].fillna('').agg('|'.join, axis=1)
+    frame = frame[keys.str.strip('|') != ''].assign(key=keys)
+    return frame.drop_duplicates(subset='key').set_index('key')
+
+
+# One hash per row over the compared columns, missing values hash like empty ones
+def content_hashes(frame, columns):
+    return pd.Series(pd.util.hash_pandas_object(frame[columns].fillna(''), index=False).to_numpy(), index=frame.index)
+
+
+# New, changed and removed rows of a portal's output against the previous one, with the counts
+def portal_delta(portal, directory, previous=None):
+    previous = previous or previous_directory(portal, directory)
+    current_frame = read_output(portal, directory)
+    if current_frame is None:
+        return None, None
+    previous_frame = read_output(portal, previous)
+    if previous_frame is None:
+        # First run: every job is new
+        previous, previous_frame = None, current_frame.iloc[:0]
+
+    key_columns = None
+    if not has_ids(portal, current_frame) or (previous is not None and not has_ids(portal, previous_frame)):
+        key_columns = [PORTAL_FIELDS[portal][field] for field in FALLBACK_KEY_FIELDS
+                       if PORTAL_FIELDS[portal][field] in current_frame.columns and PORTAL_FIELDS[portal][field] in previous_frame.columns]
+    current_frame = keyed(portal, current_frame, key_columns)
+    previous_frame = keyed(portal, previous_frame, key_columns)
+
+    # Older outputs may lack columns added since, compare what both days have
+    columns = [column for column in current_frame.columns
+               if column in previous_frame.columns and column not in VOLATILE_COLUMNS.get(portal, set())]
+    joined = pd.merge(
+        content_hashes(current_frame, columns).rename('current'),
+        content_hashes(previous_frame, columns).rename('previous'),
+        left_index=True, right_index=True, how='outer',
+    )
+
+    new_ids = joined.index[joined['previous'].isna()]
+    removed_ids = joined.index[joined['current'].isna()]
+    both = joined[joined['current'].notna() & joined['previous'].notna()]
+    changed_ids = both.index[both['current'] != both['previous']]
+
+    # Names of the compared columns that differ on each changed row
+    differs = current_frame.loc[changed_ids, columns].fillna('') != previous_frame.loc[changed_ids, columns].fillna('')
+    changed_fields = differs.dot(pd.Index(columns) + ', ').str.rstrip(', ')
+
+    delta = pd.concat([
+        current_frame.loc[new_ids].assign(change='new'),
+        current_frame.loc[changed_ids].assign(change='changed', changed_fields=changed_fields),
+        previous_frame.loc[removed_ids].assign(change='removed'),
+    ])
+    # The job ID goes back to being a column, a title, company and link key is dropped
+    delta.index.name = PORTAL_FIELDS[portal]['job_id']
+    delta = delta.reset_index(drop=key_columns is not None)
+    delta = delta[['change', 'changed_fields'] + [column for column in delta.columns if column not in ('change', 'changed_fields')]]
+
+    summary = {
+        'previous_day': os.path.basename(os.path.normpath(previous)) if previous else None,
+        'joined_on': 'job_id' if key_columns is None else ', '.join(key_columns),
+        'jobs': len(current_frame),
+        'new': len(new_ids),
+        'changed': len(changed_ids),
+        'removed': len(removed_ids),
+        'unchanged': len(both) - len(changed_ids),
+    }
+    return delta, summary
+
+
+# Write a portal's delta to the delta folder of its day and add its counts to the day's summary
+def write_delta(portal, directory=None, previous=None):
+    directory = directory or Config.output_csv_path1
+    delta, summary = portal_delta(portal, directory, previous)
+    if delta is None:
+        print(f'No {portal} output in {directory} to compare')
+        return None
+
+    delta_directory = os.path.join(Config.delta_directory, os.path.basename(os.path.normpath(directory)))
+    os.makedirs(delta_directory, exist_ok=True)
+    delta.to_csv(os.path.join(delta_directory, Config.output_csv_delta.format(portal=portal)), index=False)
+    summary_path = os.path.join(delta_directory, Config.output_delta_summary)
+    with _summary_lock:
+        summaries = {}
+        if os.path.exists(summary_path):
+            with open(summary_path) as f:
+                summaries = json.load(f)
+        summaries[portal] = summary
+        with open(summary_path, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+    print(f"{portal} against {summary['previous_day'] or 'nothing (first run)'}: {summary['new']} new, "
+          f"{summary['changed']} changed, {summary['removed']} removed, {summary['unchanged']} unchanged")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the new, changed and removed jobs of a day against the previous run')
+    parser.add_argument('--portals', nargs='+', default=list(Config.portal_output_files), choices=list(Config.portal_output_files))
+    parser.add_argument('--day', help='day folder to compare, today by default')
+    parser.add_argument('--previous', help='day folder to compare with, the latest earlier one by default')
+    args = parser.parse_args(argv)
+
+    directory = os.path.join(Config.output_directory, args.day) if args.day else Config.output_csv_path1
+    previous = os.path.join(Config.output_directory, args.previous) if args.previous else None
+    for portal in args.portals:
+        write_delta(portal, directory, previous)
+
+
+if __name__ == "__main__":
+    main()
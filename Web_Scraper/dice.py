@@ -1,15 +1,25 @@
-import os
-import pytz
-import requests
+import numpy as np
 import pandas as pd
 from config import Config
-from datetime import datetime
+from http_client import get_client
+from metrics import get_metrics
+from seen_index import SeenIndex
+from checkpoint import run_units
+from run_clock import get_clock
 from urllib.parse import urlparse, parse_qs
 
 class Wrapper:
+    portal = "Dice"
+    # Rows left out of the output and the column that identifies a job
+    output_exclude = None
+    id_column = 'Job_id'
+
     # Initialize the class with configuration settings
     def __init__(self):
         self.config = Config()
+        self.client = get_client()
+        self.max_workers = self.config.portal_concurrency["Dice"]
+        self.seen_index = SeenIndex("Dice")
 
     # Parse URL and extract relevant parameters
     def parse_url(self, url):
@@ -23,70 +33,112 @@ class Wrapper:
 
         return q, location, latitude, longitude
 
-    # Fill the location based on Work type (remote/on-site)
-    def fill_location(self, row):
-        return 'Remote' if row['Work type(remote/on-site)'] else 'Hybrid/Onsite'
-
-    # Create the output directory if it doesn't exist
+    # Fill the location of a whole column of remote flags at once
+    def fill_locations(self, is_remote):
+        return pd.Series(np.where(is_remote.fillna(False).astype(bool), 'Remote', 'Hybrid/Onsite'), index=is_remote.index)
+
+    # Turn the merged API results of one keyword into the output columns
+    def get_data(self, data, keyword):
+        df = pd.DataFrame(data)
+        df.drop_duplicates(subset='id', inplace=True)
+        df['jobLocation'] = df['jobLocation'].apply(lambda x: x['displayName'] if isinstance(x, dict) and 'displayName' in x else None)
+        df1 = df[['id', 'title', 'postedDate', 'detailsPageUrl', 'jobLocation', 'salary', 'companyName', 'employmentType',
+                  'workFromHomeAvailability', 'isRemote', 'modifiedDate']]
+        df1.rename(columns=self.get_column_mapping(), inplace=True)
+        df1['Current date time (CST)'] = get_clock().cst().strftime('%Y-%m-%dT%H:%M:%SZ')
+        # df1['Current date time'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
+        df1['Work type(remote/on-site)'] = self.fill_locations(df1['Work type(remote/on-site)'])
+        df1['Job Title'] = keyword  # Add a new column for the job title
+        return df1
+
+    # Fetch every page of every keyword in parallel, resuming from the checkpoint of an interrupted run
     def run(self):
-        output_path = os.path.join(self.config.output_csv_path2, self.config.output_csv_dice)
-        os.makedirs(self.config.output_csv_path2, exist_ok=True)
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        cst_timezone = pytz.timezone('America/Chicago')
-
-        current_time_ist = datetime.now(ist_timezone)
-        current_time_cst = current_time_ist.astimezone(cst_timezone)
-
-        for keyword in self.config.keywords:
-            params = self.get_params(keyword)
-
-            response = requests.get(
-                self.config.url_dice,
-                params=params,
-                headers=self.config.HEADERS,
-                timeout=30,
-            ).json()
-
-            try:
-                data = response["data"]
-            except Exception as e:
-                print(f"Sorry could not get the data for {keyword}: {e}")
-                continue
-
-            if data:
-                df = pd.DataFrame(data)
-                df['jobLocation'] = df['jobLocation'].apply(lambda x: x['displayName'] if isinstance(x, dict) and 'displayName' in x else None)
-                df1 = df[['id', 'title', 'postedDate', 'detailsPageUrl', 'jobLocation', 'salary', 'companyName', 'employmentType',
-                          'workFromHomeAvailability', 'isRemote', 'modifiedDate']]
-                df1.rename(columns=self.get_column_mapping(), inplace=True)
-                df1['Current date time (CST)'] = current_time_cst.strftime('%Y-%m-%dT%H:%M:%SZ')
-                # df1['Current date time'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
-                df1['Work type(remote/on-site)'] = df1.apply(self.fill_location, axis=1)
-                df1['Job Title'] = keyword  # Add a new column for the job title
-                df1.to_csv(output_path, mode='a', header=not os.path.exists(output_path), index=False)
-                print(f'Successfully saved the data for {keyword}')
-            else:
-                print(f"Sorry we can't get the data for {keyword}. Please try again with correct url or keywords")
+        run_units(self, self.config.keywords)
+
+    # Call the search API for one page of a keyword, an empty dict if the call fails
+    def fetch_page(self, keyword, page):
+        params = self.get_params(keyword, page)
+        metrics = get_metrics()
+
+        try:
+            with metrics.page("Dice", keyword, page):
+                response = self.client.get(
+                    self.config.url_dice,
+                    params=params,
+                    headers=self.config.HEADERS,
+                    use_proxy=False,
+                    portal="Dice",
+                )
+                with metrics.stage("parse"):
+                    return response.json()
+        except Exception as e:
+            print(f"Sorry could not fetch page {page} for {keyword}: {e}")
+            return {}
+
+    # Number of pages to fetch for a keyword, read from the totals of its first page and capped by the config
+    def get_page_count(self, response):
+        meta = response.get("meta") or {}
+        page_count = meta.get("pageCount")
+
+        if page_count is None and meta.get("totalResults") is not None:
+            page_size = int(meta.get("pageSize") or self.config.dice_page_size)
+            page_count = -(-int(meta["totalResults"]) // page_size)
+
+        return max(1, min(int(page_count or 1), self.config.dice_max_pages))
+
+    # In incremental mode a first page made only of jobs from earlier runs means there is nothing new to page through
+    def first_page_seen(self, keyword, response):
+        if not self.config.incremental:
+            return False
+
+        if self.seen_index.all_seen(job.get("id") for job in response.get("data") or []):
+            print(f"All jobs on the first page for {keyword} were already scraped, skipping the rest")
+            return True
+        return False
+
+    # Pages every keyword starts from
+    def first_pages(self):
+        return [1]
+
+    # Scrape one (keyword, page) unit on its own, the first page of a keyword leads to its remaining pages
+    def scrape_page(self, keyword, page):
+        response = self.fetch_page(keyword, page)
+        data = response.get("data")
+
+        next_pages = []
+        if page == 1 and data and not self.first_page_seen(keyword, response):
+            next_pages = list(range(2, self.get_page_count(response) + 1))
+
+        # An empty response means the request failed, a keyword without hits answers with empty data
+        if not response:
+            return None, next_pages
+        if not data:
+            print(f"No jobs for {keyword} on page {page}")
+            return pd.DataFrame(), next_pages
+
+        with get_metrics().page("Dice", keyword, page):
+            with get_metrics().stage("transform"):
+                return self.get_data(data, keyword), next_pages
 
     # Get parameters based on search type
-    def get_params(self, keyword):
+    def get_params(self, keyword, page=1):
         if self.config.search_type == '1':
-            return self.get_keyword_params(keyword)
+            return self.get_keyword_params(keyword, page)
         elif self.config.search_type == '2':
-            return self.get_url_params(keyword)
+            return self.get_url_params(keyword, page)
         else:
             print("Invalid search type")
             return {}
 
     # Get parameters for keyword-based search
-    def get_keyword_params(self, keyword):
+    def get_keyword_params(self, keyword, page=1):
         return {
             "q": keyword,
             "countryCode2": "US",
             "radius": "30",
             "radiusUnit": "mi",
-            "page": "1",
-            "pageSize": "100",
+            "page": str(page),
+            "pageSize": str(self.config.dice_page_size),
             "facets": "employmentType|postedDate|workFromHomeAvailability|employerType|easyApply|isRemote",
             "fields": "id|jobId|guid|summary|title|postedDate|modifiedDate|jobLocation.displayName|detailsPageUrl|salary|companyName|employmentType|isHighlighted|score|easyApply|employerType|workFromHomeAvailability|isRemote|debug",
             "culture": "en",
@@ -98,18 +150,18 @@ class Wrapper:
         }
 
     # Get parameters for URL-based search
-    def get_url_params(self, keyword):
+    def get_url_params(self, keyword, page=1):
         q, location, latitude, longitude = self.parse_url(keyword)
         return {
             "countryCode2": "US",
             "radius": "100",
             "radiusUnit": "mi",
-            "page": "1",
+            "page": str(page),
             "q": q,
             "locationPrecision": 'city',
             "latitude": latitude,
             "longitude": longitude,
-            "pageSize": "100",
+            "pageSize": str(self.config.dice_page_size),
             "facets": "employmentType|postedDate|workFromHomeAvailability|employerType|easyApply|isRemote",
             "fields": "id|jobId|guid|summary|title|postedDate|modifiedDate|jobLocation.displayName|detailsPageUrl|salary|companyName|employmentType|isHighlighted|score|easyApply|employerType|workFromHomeAvailability|isRemote|debug",
             "culture": "en",
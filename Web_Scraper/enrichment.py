@@ -0,0 +1,260 @@
+# enrichment.py optional stage that adds full descriptions, skills and contract duration from each job's detail page
+#
+#     python enrichment.py                              enrich today's outputs of every portal
+#     python enrichment.py --day 2024-02-02 --portals Dice
+#
+# Parsed details are kept in an SQLite store keyed by portal and job ID, so a job seen on an earlier day is
+# never fetched again, and the details of every job in a day's output are written to details_<portal>.csv
+
+import os
+import re
+import json
+import html
+import sqlite3
+import argparse
+import threading
+import pandas as pd
+
+from config import Config
+from metrics import get_metrics
+from resilience import get_guard
+from http_client import get_client
+from parsing import make_soup
+from job_record import PORTAL_FIELDS
+from seen_index import valid_id
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Element holding the description on each portal's detail page, used when the page has no JobPosting JSON-LD
+DESCRIPTION_SELECTORS = {
+    'ZipRecruiter': 'div.job_description',
+    'Indeed': 'div#jobDescriptionText',
+    'CareerBuilder': 'div#jdp_description',
+    'Dice': 'div[data-testid="jobDescriptionHtml"]',
+}
+
+JSON_LD_PATTERN = re.compile(rb'<script\b[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script\s*>', re.DOTALL | re.IGNORECASE)
+
+# "Duration: 6 months", "12+ month contract", "Length of assignment: 3-6 months"
+DURATION_UNITS = r'(?:months?|mos?|weeks?|wks?|years?|yrs?)\b'
+DURATION_PATTERNS = [
+    re.compile(r'(?i)\b(?:duration|length|term|assignment|contract)\b[^.\n]{0,40}?\b(\d+\s*\+?\s*(?:(?:-|to)\s*\d+\s*\+?\s*)?' + DURATION_UNITS + ')'),
+    re.compile(r'(?i)\b(\d+\s*\+?\s*(?:(?:-|to)\s*\d+\s*\+?\s*)?' + DURATION_UNITS + r')[^.\n]{0,20}?\b(?:contract|assignment|project)\b'),
+]
+
+DETAIL_COLUMNS = ['portal', 'job_id', 'description', 'skills', 'contract_duration', 'fetched_at']
+
+
+# Pattern matching any skill of the vocabulary as a whole word, with each match mapped back to its spelling
+def skill_pattern(skills):
+    alternatives = '|'.join(re.escape(skill) for skill in sorted(skills, key=len, reverse=True))
+    return re.compile(rf'(?i)(?<![\w+#])({alternatives})(?![\w+#])'), {skill.lower(): skill for skill in skills}
+
+
+SKILL_PATTERN, SKILL_NAMES = skill_pattern(Config.enrichment_skills)
+
+
+# The JobPosting object of a page's JSON-LD, None when it has none
+def job_posting(content):
+    for match in JSON_LD_PATTERN.finditer(content):
+        try:
+            data = json.loads(match.group(1).decode('utf-8', errors='replace'))
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else data.get('@graph', [data]):
+            if isinstance(item, dict) and item.get('@type') == 'JobPosting':
+                return item
+    return None
+
+
+# Plain text of an HTML fragment
+def html_text(fragment):
+    text = re.sub(r'<(?:br|/p|/li|/div|/h\d)\b[^>]*>', '\n', fragment, flags=re.IGNORECASE)
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', text))
+    return re.sub(r'[ \t\r\f\v]+', ' ', re.sub(r'\s*\n\s*', '\n', text)).strip()
+
+
+def find_skills(text, listed=None):
+    found = {SKILL_NAMES[match.lower()] for match in SKILL_PATTERN.findall(text)}
+    if isinstance(listed, list):
+        listed = ', '.join(str(skill) for skill in listed)
+    if listed:
+        found.update(skill.strip() for skill in re.split(r'[,;|]', html_text(str(listed))) if skill.strip())
+    return sorted(found, key=str.lower)
+
+
+def find_duration(text):
+    for pattern in DURATION_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return re.sub(r'\s+', ' ', match.group(1)).strip()
+    return None
+
+
+# Description, skills and contract duration of a detail page, None when the page has no description
+def parse_details(content, portal):
+    posting = job_posting(content)
+    if posting and posting.get('description'):
+        description = html_text(posting['description'])
+        listed_skills = posting.get('skills')
+    else:
+        element = make_soup(content).select_one(DESCRIPTION_SELECTORS[portal])
+        if element is None:
+            return None
+        description = element.get_text('\n', strip=True)
+        listed_skills = None
+
+    return {
+        'description': description,
+        'skills': ', '.join(find_skills(description, listed_skills)),
+        'contract_duration': find_duration(description),
+    }
+
+
+class DetailStore:
+    # Parsed details of every job enriched so far, one row per (portal, job_id)
+    def __init__(self, path=None):
+        self.path = path or Config.enrichment_db_path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS job_details ('
+            'portal TEXT NOT NULL, job_id TEXT NOT NULL, description TEXT, skills TEXT, contract_duration TEXT, '
+            'fetched_at TEXT NOT NULL, PRIMARY KEY (portal, job_id)) WITHOUT ROWID'
+        )
+        self.connection.commit()
+
+    # Job IDs of a portal that are already enriched, looked up in chunks to stay under SQLite's variable limit
+    def known(self, portal, job_ids):
+        job_ids = list(job_ids)
+        known = set()
+        with self.lock:
+            for start in range(0, len(job_ids), 500):
+                chunk = job_ids[start:start + 500]
+                rows = self.connection.execute(
+                    f'SELECT job_id FROM job_details WHERE portal = ? AND job_id IN ({",".join("?" * len(chunk))})',
+                    [portal] + chunk,
+                )
+                known.update(row[0] for row in rows)
+        return known
+
+    def save(self, rows):
+        with self.lock:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO job_details (portal, job_id, description, skills, contract_duration, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            self.connection.commit()
+
+    def details(self, portal, job_ids):
+        job_ids = list(job_ids)
+        frames = []
+        with self.lock:
+            for start in range(0, len(job_ids), 500):
+                chunk = job_ids[start:start + 500]
+                frames.append(pd.read_sql_query(
+                    f'SELECT {", ".join(DETAIL_COLUMNS)} FROM job_details WHERE portal = ? AND job_id IN ({",".join("?" * len(chunk))})',
+                    self.connection, params=[portal] + chunk,
+                ))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=DETAIL_COLUMNS)
+
+    def close(self):
+        self.connection.close()
+
+
+# Fetch and parse one detail page, None when it failed or had no description
+def fetch_details(client, portal, job_id, url):
+    with get_metrics().page(portal, 'details'):
+        try:
+            response = client.get(url, portal=portal)
+            response.raise_for_status()
+            with get_metrics().stage('parse', portal):
+                details = parse_details(response.content, portal)
+        except Exception as e:
+            print(f'Sorry, could not enrich {portal} job {job_id}: {e}')
+            return None
+    if details is None:
+        print(f'No description found on the {portal} page of job {job_id}')
+    return details
+
+
+# Enrich the jobs of a portal's output in a day folder that no earlier run enriched, then write the details of
+# all of its jobs next to the output. Requests run Config.portal_concurrency[portal] at a time
+def enrich_portal(portal, directory=None, store=None):
+    directory = directory or Config.output_csv_path1
+    output_path = os.path.join(directory, Config.portal_output_files[portal])
+    if not os.path.exists(output_path):
+        print(f'No {portal} output in {directory} to enrich')
+        return 0
+
+    columns = PORTAL_FIELDS[portal]
+    jobs = pd.read_csv(output_path, dtype=str, usecols=lambda column: column in (columns['job_id'], columns['url']))
+    if len(jobs.columns) < 2:
+        print(f'The {portal} output in {directory} has no job IDs or links to enrich')
+        return 0
+    jobs = jobs.dropna().drop_duplicates(subset=columns['job_id'])
+    jobs = jobs[[valid_id(job_id) for job_id in jobs[columns['job_id']]]]
+
+    own_store = store is None
+    store = store or DetailStore()
+    known = store.known(portal, jobs[columns['job_id']])
+    todo = jobs[~jobs[columns['job_id']].isin(known)]
+    print(f'Enriching {len(todo)} {portal} jobs, {len(known)} were enriched before')
+
+    client = get_client()
+    guard = get_guard(portal)
+    rows = []
+    enriched = 0
+    stopped = False
+    with ThreadPoolExecutor(max_workers=Config.portal_concurrency.get(portal, 1)) as executor:
+        futures = {executor.submit(fetch_details, client, portal, job_id, url): job_id
+                   for job_id, url in zip(todo[columns['job_id']], todo[columns['url']])}
+        for future in as_completed(futures):
+            details = None if future.cancelled() else future.result()
+            if details is None:
+                continue
+            fetched_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            rows.append((portal, futures[future], details['description'], details['skills'], details['contract_duration'], fetched_at))
+            if len(rows) >= Config.enrichment_batch_size:
+                store.save(rows)
+                enriched += len(rows)
+                rows = []
+            # Once the portal keeps blocking us the rest of the pages are left for the next run
+            if not stopped and guard.is_open():
+                stopped = True
+                print(f'{portal} keeps blocking us, leaving the remaining detail pages for the next run')
+                for pending in futures:
+                    pending.cancel()
+    store.save(rows)
+    enriched += len(rows)
+    get_metrics().count('details_enriched', enriched, portal)
+
+    details = store.details(portal, jobs[columns['job_id']])
+    details.to_csv(os.path.join(directory, Config.output_csv_details.format(portal=portal)), index=False)
+    print(f'Saved details of {len(details)} {portal} jobs, {enriched} fetched in this run')
+    if own_store:
+        store.close()
+    return enriched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Add descriptions, skills and contract duration from the detail pages')
+    parser.add_argument('--portals', nargs='+', default=list(Config.portal_output_files), choices=list(Config.portal_output_files))
+    parser.add_argument('--day', help='day folder to enrich, today by default')
+    args = parser.parse_args(argv)
+
+    directory = os.path.join(Config.output_directory, args.day) if args.day else Config.output_csv_path1
+    store = DetailStore()
+    # Portals are enriched side by side, each within its own concurrency limit
+    with ThreadPoolExecutor(max_workers=len(args.portals)) as executor:
+        futures = [executor.submit(enrich_portal, portal, directory, store) for portal in args.portals]
+        for future in futures:
+            future.result()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# history_store.py indexed SQLite store of every scraped day with full-text search on titles
+
+import os
+import glob
+import sqlite3
+import argparse
+
+from config import Config
+from datetime import datetime
+from job_record import load_outputs
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        portal TEXT NOT NULL,
+        job_id TEXT NOT NULL,
+        title TEXT,
+        company TEXT COLLATE NOCASE,
+        location TEXT COLLATE NOCASE,
+        pay TEXT,
+        job_type TEXT,
+        work_type TEXT,
+        posted TEXT,
+        url TEXT,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        UNIQUE (portal, job_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS jobs_last_seen ON jobs (last_seen)',
+    'CREATE INDEX IF NOT EXISTS jobs_first_seen ON jobs (first_seen)',
+    'CREATE INDEX IF NOT EXISTS jobs_company ON jobs (company)',
+    'CREATE INDEX IF NOT EXISTS jobs_location ON jobs (location)',
+    # Title search index kept in sync with the jobs table by triggers
+    "CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5 (title, content='jobs', content_rowid='id')",
+    '''CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts (rowid, title) VALUES (new.id, new.title);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+        INSERT INTO jobs_fts (jobs_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF title ON jobs BEGIN
+        INSERT INTO jobs_fts (jobs_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO jobs_fts (rowid, title) VALUES (new.id, new.title);
+    END''',
+    '''CREATE TABLE IF NOT EXISTS ingested_days (
+        day TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL,
+        ingested_at TEXT NOT NULL
+    )''',
+]
+
+UPSERT = '''
+    INSERT INTO jobs (portal, job_id, title, company, location, pay, job_type, work_type, posted, url, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (portal, job_id) DO UPDATE SET
+        title = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.title ELSE jobs.title END,
+        company = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.company ELSE jobs.company END,
+        location = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.location ELSE jobs.location END,
+        pay = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.pay ELSE jobs.pay END,
+        job_type = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.job_type ELSE jobs.job_type END,
+        work_type = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.work_type ELSE jobs.work_type END,
+        posted = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.posted ELSE jobs.posted END,
+        url = CASE WHEN excluded.last_seen >= jobs.last_seen THEN excluded.url ELSE jobs.url END,
+        first_seen = MIN(jobs.first_seen, excluded.first_seen),
+        last_seen = MAX(jobs.last_seen, excluded.last_seen)
+'''
+
+ROW_FIELDS = ['portal', 'job_id', 'title', 'company', 'location', 'pay', 'job_type', 'work_type', 'posted', 'url']
+
+
+class HistoryStore:
+    def __init__(self, path=None):
+        self.path = path or Config.history_db_path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def ingested_days(self):
+        return {row['day'] for row in self.connection.execute('SELECT day FROM ingested_days')}
+
+    # Load one day folder, upserting every job keyed by portal and job ID in batches
+    def ingest_day(self, directory):
+        day = os.path.basename(os.path.normpath(directory))
+        frame = load_outputs([directory])
+        # The store is keyed by job ID, rows without one cannot be upserted
+        skipped = int(frame['job_id'].isna().sum())
+        if skipped:
+            print(f'Skipped {skipped} jobs without a job ID for {day}')
+        frame = frame[frame['job_id'].notna()]
+
+        columns = [frame[field].astype(object).where(frame[field].notna(), None).tolist() for field in ROW_FIELDS]
+        rows = [values + (day, day) for values in zip(*columns)]
+
+        with self.connection:
+            for start in range(0, len(rows), Config.history_batch_size):
+                self.connection.executemany(UPSERT, rows[start:start + Config.history_batch_size])
+            self.connection.execute(
+                'INSERT OR REPLACE INTO ingested_days (day, row_count, ingested_at) VALUES (?, ?, ?)',
+                (day, len(rows), datetime.now().strftime('%Y-%m-%dT%H:%M:%S')),
+            )
+        print(f'Ingested {len(rows)} jobs for {day}')
+        return len(rows)
+
+    # Load every day folder that is not in the store yet (or all of them with force)
+    def ingest(self, directories=None, force=False):
+        directories = directories or sorted(path for path in glob.glob(os.path.join(Config.output_directory, '*')) if os.path.isdir(path) and os.path.basename(path)[:1].isdigit())
+        done = set() if force else self.ingested_days()
+        return sum(self.ingest_day(directory) for directory in directories if os.path.basename(os.path.normpath(directory)) not in done)
+
+    # Find jobs by title text (FTS5 syntax) and/or company, location prefix, job type and the days they were seen
+    def search(self, text=None, company=None, location=None, job_type=None, since=None, until=None, limit=100):
+        clauses, params = [], []
+        if text:
+            clauses.append('jobs.id IN (SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ?)')
+            params.append(text)
+        if company:
+            clauses.append('jobs.company = ?')
+            params.append(company)
+        if location:
+            clauses.append('jobs.location LIKE ?')
+            params.append(location.replace('%', '') + '%')
+        if job_type:
+            clauses.append('jobs.job_type LIKE ?')
+            params.append(f'%{job_type}%')
+        if since:
+            clauses.append('jobs.last_seen >= ?')
+            params.append(since)
+        if until:
+            clauses.append('jobs.first_seen <= ?')
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        query = f'SELECT * FROM jobs {where} ORDER BY jobs.last_seen DESC LIMIT ?'
+        return [dict(row) for row in self.connection.execute(query, params + [limit])]
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load scraped days into the history store and search it')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='load day folders (default: every folder under output/ not loaded yet)')
+    ingest.add_argument('directories', nargs='*')
+    ingest.add_argument('--force', action='store_true', help='reload days that were already ingested')
+
+    search = commands.add_parser('search', help='search stored jobs')
+    search.add_argument('text', nargs='?', help='title search, FTS5 syntax e.g. "data analyst"')
+    search.add_argument('--company')
+    search.add_argument('--location', help='location prefix, e.g. Chicago')
+    search.add_argument('--job-type')
+    search.add_argument('--since', help='seen on or after YYYY-MM-DD')
+    search.add_argument('--until', help='seen on or before YYYY-MM-DD')
+    search.add_argument('--limit', type=int, default=100)
+
+    args = parser.parse_args()
+    store = HistoryStore()
+    if args.command == 'ingest':
+        store.ingest(args.directories, force=args.force)
+    else:
+        for job in store.search(args.text, args.company, args.location, args.job_type, args.since, args.until, args.limit):
+            print(f"{job['last_seen']}  {job['portal']:<13} {job['title']} | {job['company']} | {job['location']} | {job['pay']}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
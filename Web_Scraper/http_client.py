@@ -0,0 +1,116 @@
+# http_client.py shared fetch layer for the Job Portals
+
+import time
+import random
+import threading
+import warnings
+import requests
+
+from config import Config
+from metrics import get_metrics
+from rate_limiter import get_limiter
+from proxy_pool import ProxyPool, get_pool, classify, FAILED
+from resilience import get_guard, is_blocked
+from response_cache import get_cache
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+warnings.filterwarnings('ignore')
+
+
+class HttpClient:
+    # A proxy given here is used for every request, otherwise requests are spread over the pool of Config.proxies
+    def __init__(self, proxy=None, pool_connections=None, pool_maxsize=None, timeout=None):
+        self.proxy_pool = ProxyPool([proxy]) if proxy else get_pool()
+        self.timeout = timeout or (Config.connect_timeout, Config.read_timeout)
+
+        # One adapter holds the connection pools and is shared by every thread, so
+        # connections to a host (or through each proxy) are kept alive and reused
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections or Config.http_pool_connections,
+            pool_maxsize=pool_maxsize or Config.http_pool_maxsize,
+        )
+        self.local = threading.local()
+        self.cache = get_cache()
+
+    # Sessions keep cookies and are not thread safe, so each thread gets its own on top of the shared pool
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self.local.session = session
+        return session
+
+    # Build request headers, rotating the user agent unless the caller supplies one
+    def build_headers(self, headers=None):
+        merged = dict(headers or {})
+        if not any(key.lower() == 'user-agent' for key in merged):
+            merged['User-Agent'] = random.choice(Config.USER_AGENT_LIST)
+        return merged
+
+    # GET a url with retries and the portal's circuit breaker, raises resilience.PortalUnavailable / BlockedPage
+    def get(self, url, params=None, headers=None, use_proxy=True, timeout=None, portal=None):
+        return get_guard(portal).call(lambda: self.attempt(url, params, headers, use_proxy, timeout, portal))
+
+    # One attempt at a url, recording its time, status and size in the run metrics
+    def attempt(self, url, params=None, headers=None, use_proxy=True, timeout=None, portal=None):
+        metrics = get_metrics()
+        with metrics.stage('fetch', portal):
+            response = self.fetch(url, params, headers, use_proxy, timeout, portal)
+        metrics.record_response(portal, response)
+        return response
+
+    # GET a url, through a proxy of the pool unless use_proxy is False, answering from the response cache when it can
+    def fetch(self, url, params=None, headers=None, use_proxy=True, timeout=None, portal=None):
+        if self.cache.enabled:
+            cached = self.cache.get(url, params, portal)
+            # A block page cached by an older version is fetched again rather than replayed as a result page
+            if cached is not None and not is_blocked(cached):
+                return cached
+            if self.cache.replay:
+                return self.cache.miss_response(url)
+
+        proxy = self.proxy_pool.acquire(portal) if use_proxy else None
+        limiter = get_limiter(urlparse(url).netloc, proxy)
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session().get(
+                url,
+                params=params,
+                headers=self.build_headers(headers),
+                proxies={"http": proxy, "https": proxy} if proxy else None,
+                # The proxy re-signs TLS traffic, so certificates can only be checked on direct requests
+                verify=not use_proxy,
+                timeout=timeout or self.timeout,
+            )
+        except requests.RequestException:
+            if proxy:
+                self.proxy_pool.release(proxy, portal, time.perf_counter() - start, FAILED)
+            raise
+        if proxy:
+            self.proxy_pool.release(proxy, portal, time.perf_counter() - start, classify(response))
+        limiter.record(response)
+
+        # Block pages answer with 200 too, they are never cached
+        if self.cache.enabled and not is_blocked(response):
+            self.cache.put(response, url, params, portal)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Return the process wide client shared by all scrapers
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
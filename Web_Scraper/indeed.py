@@ -1,22 +1,38 @@
 import re
-import os
 import json
-import pytz
-import random
 import warnings
+import threading
 import requests
 import numpy as np
 import pandas as pd
 
 from config import Config
-from datetime import datetime
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, parse_qs
+from http_client import get_client
+from metrics import get_metrics
+from parsing import make_soup, extract_script
+from seen_index import SeenIndex
+from checkpoint import run_units
+from run_clock import get_clock
 
 warnings.filterwarnings('ignore')
 
 class IndeedScraper:
+    portal = "Indeed"
+    # Rows left out of the output and the column that identifies a job
+    output_exclude = {'Job Type': 'Full-time'}
+    id_column = 'Job ID'
+    # Result offsets of the search pages
+    pages = list(range(0, 120, 10))
+
     def __init__(self):
+        self.client = get_client()
+        self.max_workers = Config.portal_concurrency["Indeed"]
+        self.seen_index = SeenIndex("Indeed")
+
+        # Job keys already scraped per keyword, a page repeating them means the results ran out
+        self.keyword_keys = {}
+        self.keys_lock = threading.Lock()
+
         # Mapping for column names
         self.column_mapping = {
             'company': 'Company',
@@ -30,9 +46,15 @@ class IndeedScraper:
             'job_key': 'Job ID'
         }
 
+        # Raw column order of the records collected from each page
+        self.record_columns = [
+            'company', 'salary_text', 'pub_date', 'display_title', 'job_location',
+            'job_key', 'view_job_link', 'job_types', 'Job Location'
+        ]
+
     # Function to find job types from the list of attributes
     def find_job_types(self, attributes_list): 
-        for attr in attributes_list:
+        for attr in attributes_list or []:
             if 'job-types' in attr.get('label', ''):
                 if 'attributes' in attr:
                     for sub_attr in attr['attributes']:
@@ -51,46 +73,50 @@ class IndeedScraper:
         else:
             return None
 
-    # Function to fill the location based on Job Location
-    def fill_location(self, row):
-        if row['Job Location']:
-            return 'Remote'
-        else:
-            return 'Hybrid/On Site'
-
     # Function to extract data from the soup object
     def get_data(self, soup):
         script = soup.find('script', id='mosaic-data')
-        script_content = str(script.string)
+        return self.get_data_from_script(str(script.string))
+
+    # Function to parse a raw page, only pulling out the mosaic-data script and falling back to a full parse if it moved
+    def parse_page(self, content):
+        metrics = get_metrics()
+        with metrics.stage('parse', 'Indeed'):
+            script_content = extract_script(content, 'mosaic-data')
+
+        if script_content is None:
+            with metrics.stage('parse', 'Indeed'):
+                soup = make_soup(content)
+            with metrics.stage('transform', 'Indeed'):
+                return self.get_data(soup)
+
+        with metrics.stage('transform', 'Indeed'):
+            return self.get_data_from_script(script_content)
+
+    # Function to extract data from the mosaic-data script content
+    def get_data_from_script(self, script_content):
         pattern = re.compile(r'window\.mosaic\.providerData\["mosaic-provider-jobcards"\]\s*=\s*({.*?});', re.DOTALL)
         match = pattern.search(script_content)
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        cst_timezone = pytz.timezone('America/Chicago')
-
-        current_time_ist = datetime.now(ist_timezone)
-        current_time_cst = current_time_ist.astimezone(cst_timezone)
+        clock = get_clock()
 
         if match:
             json_data = match.group(1)
             parsed_data = json.loads(json_data)
         else:
             print("No match found.")
+            return None
 
         metadata = parsed_data['metaData']
         mosaic_provider_jobcards_model = metadata['mosaicProviderJobCardsModel']
         results = mosaic_provider_jobcards_model['results']
 
-        all_inner_dataframes = []
+        pub_date = clock.cst().strftime('%Y-%m-%dT%H:%M:%SZ')
+        # pub_date = datetime.utcfromtimestamp(extracted_data['pubDate'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        records = []
 
         for result in results:
-            fields_to_extract = [
-                'company', 'formattedLocation', 'remoteLocation', 'estimatedSalary', 'extractedSalary',
-                'jobkey', 'pubDate', 'taxonomyAttributes', 'viewJobLink', 'title'
-            ]
-
-            extracted_data = {field: result.get(field) for field in fields_to_extract}
-            extracted_salary = extracted_data.get('extractedSalary')
-            estimated_salary = extracted_data.get('estimatedSalary')
+            extracted_salary = result.get('extractedSalary')
+            estimated_salary = result.get('estimatedSalary')
 
             if extracted_salary is not None:
                 salary_text = self.format_salary_range(extracted_salary)
@@ -99,86 +125,88 @@ class IndeedScraper:
             else:
                 salary_text = None
 
-            pub_date = current_time_cst.strftime('%Y-%m-%dT%H:%M:%SZ')
-            # pub_date = datetime.utcfromtimestamp(extracted_data['pubDate'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-            company = extracted_data['company']
-            display_title = extracted_data.get('title', '')
-            job_location = extracted_data.get('formattedLocation', '')
-            job_key = extracted_data.get('jobkey', '')
-            view_job_link = extracted_data.get('viewJobLink', '')
-            job_types = self.find_job_types(extracted_data['taxonomyAttributes'])
-            remotelocation = extracted_data['remoteLocation']
-
-            dataframe = pd.DataFrame({
-                'company': [company],
-                'salary_text': [salary_text],
-                'pub_date': [pub_date],
-                'display_title': [display_title],
-                'job_location': [job_location],
-                'job_key': [job_key],
-                'view_job_link': [view_job_link],
-                'job_types': [job_types],
-                'Job Location': [remotelocation]
-            })
-
-            dataframe['Current Date Time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            dataframe['Remote / Hybrid'] = dataframe.apply(self.fill_location, axis=1)
-            dataframe['view_job_link'] = 'https://www.indeed.com' + dataframe['view_job_link']
-            dataframe.rename(columns=self.column_mapping, inplace=True)
-            dataframe.drop(columns='Job Location', axis=1, inplace=True)
-            all_inner_dataframes.append(dataframe)
-
-        dataframes = pd.concat(all_inner_dataframes, ignore_index=True)
-        return dataframes
-
-    # Function to run the Indeed scraper
+            records.append((
+                result.get('company'),
+                salary_text,
+                pub_date,
+                result.get('title'),
+                result.get('formattedLocation'),
+                result.get('jobkey'),
+                result.get('viewJobLink'),
+                self.find_job_types(result.get('taxonomyAttributes')),
+                result.get('remoteLocation'),
+            ))
+
+        # Build the whole page at once and derive the remaining columns on full columns
+        dataframe = pd.DataFrame.from_records(records, columns=self.record_columns)
+        dataframe['Current Date Time'] = clock.local().strftime("%Y-%m-%d %H:%M:%S")
+        dataframe['Remote / Hybrid'] = np.where(dataframe['Job Location'].astype(bool), 'Remote', 'Hybrid/On Site')
+        dataframe['view_job_link'] = 'https://www.indeed.com' + dataframe['view_job_link']
+        dataframe.rename(columns=self.column_mapping, inplace=True)
+        dataframe.drop(columns='Job Location', inplace=True)
+        return dataframe
+
+    # Function to fetch and parse a single results page, returns None when the page has no data
+    def fetch_page(self, keyword, i):
+        with get_metrics().page('Indeed', keyword, i):
+            return self.fetch_and_parse(keyword, i)
+
+    # Function to fetch one results page and parse it into a dataframe
+    def fetch_and_parse(self, keyword, i):
+        url = Config.url_indeed.format(keyword=keyword, page=i)
+
+        try:
+            response = self.client.get(url, portal="Indeed")
+            response.raise_for_status()
+            print('Success!')
+
+            dataframe1 = self.parse_page(response.content)
+
+            if dataframe1 is not None:
+                print(f'Success for page {i} - {keyword}')
+            else:
+                print(f'Sorry, no data found for {keyword} on page {i}. Either you entered the keyword wrong or connection aborted.')
+            return dataframe1
+
+        except requests.RequestException as e:
+            # The request may have failed before any response arrived
+            status_code = e.response.status_code if e.response is not None else None
+            print(f"Error: {e}")
+            print(f"Sorry, the website blocked your connection or there was another error. Status Code: {status_code}")
+
+        except Exception as e:
+            print(f'Sorry, could not parse page {i} for {keyword}: {e}')
+
+        return None
+
+    # Function to list the pages every keyword starts from, one window of max_workers pages
+    def first_pages(self):
+        return self.pages[:self.max_workers]
+
+    # Function to scrape one (keyword, page) unit on its own. A page with new jobs moves its window on by one page,
+    # an empty or failed page, a page with no job keys we did not already get for the keyword, or (in incremental
+    # mode) a page made only of jobs from earlier runs ends that chain
+    def scrape_page(self, keyword, i):
+        dataframe1 = self.fetch_page(keyword, i)
+        if dataframe1 is None or dataframe1.empty:
+            return dataframe1, []
+
+        with self.keys_lock:
+            keyword_keys = self.keyword_keys.setdefault(keyword, set())
+            new_keys = set(dataframe1['Job ID']) - keyword_keys
+            keyword_keys.update(new_keys)
+        if not new_keys:
+            print(f'No new jobs for {keyword} on page {i}, stopping')
+            return dataframe1, []
+        if Config.incremental and self.seen_index.all_seen(dataframe1['Job ID']):
+            return dataframe1, []
+
+        next_page = i + 10 * self.max_workers
+        return dataframe1, [next_page] if next_page in self.pages else []
+
+    # Function to run the Indeed scraper, resuming from the checkpoint of an interrupted run
     def run(self):
-        # Set up output directory
-        output_directory = Config.output_directory
-        subdirectory = Config.subdirectory
-        os.makedirs(os.path.join(output_directory, subdirectory), exist_ok=True)
-        
-
-        all_outer_dataframes = []
-
-        for keyword in Config.keywords:
-            Config.keyword = keyword
-
-            for i in range(0, 120, 10):
-                url = Config.url_indeed.format(keyword=Config.keyword, page=i)
-                user_agent = random.choice(Config.USER_AGENT_LIST)
-                proxy = Config.proxy
-                proxies = {"http": proxy, "https": proxy}
-                headers = {'User-Agent': user_agent}
-
-                try:
-                    response = requests.get(url, headers=headers, proxies=proxies, verify=False)
-                    response.raise_for_status()
-                    print('Success!')
-
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    dataframe1 = self.get_data(soup)
-
-                    if dataframe1 is not None:
-                        all_outer_dataframes.append(dataframe1)
-                        print(f'Success for page {i} - {Config.keyword}')
-                    else:
-                        print(f'Sorry, no data found for {Config.keyword} on page {i}. Either you entered the keyword wrong or connection aborted.')
-
-                except requests.RequestException as e:
-                    print(f"Error: {e}")
-                    print(f"Sorry, the website blocked your connection or there was another error. Status Code: {response.status_code}")
-
-        final_dataframe = pd.concat(all_outer_dataframes, ignore_index=True)
-        final_dataframe = final_dataframe[final_dataframe['Job Type'] != 'Full-time']
-        final_dataframe.drop_duplicates(inplace=True)
-
-        # Set up output path
-        output_path = Config.output_csv_path1
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        final_dataframe.to_csv(os.path.join(output_path, Config.output_csv_indeed), index=False)
+        run_units(self)
 
 if __name__ == "__main__":
     indeed_scraper = IndeedScraper()
@@ -0,0 +1,116 @@
+# job_record.py canonical job record shared by all Job Portals
+
+import os
+import sys
+import glob
+import time
+import pandas as pd
+
+from config import Config
+from normalize import NORMALIZED_FIELDS, normalize, work_type
+
+# Canonical fields in output order
+FIELDS = ('portal', 'job_id', 'title', 'company', 'location', 'pay', 'job_type', 'work_type', 'posted', 'url', 'scraped_at')
+
+# Low-cardinality fields, stored as categoricals in frames
+CATEGORICAL_FIELDS = ('portal', 'company', 'location', 'job_type', 'work_type', 'pay_unit')
+
+# Column of each portal's output that holds every canonical field
+PORTAL_FIELDS = {
+    'ZipRecruiter': {
+        'job_id': 'JobID', 'title': 'Title', 'company': 'Company', 'location': 'City', 'pay': 'Salary',
+        'job_type': 'EmploymentType', 'work_type': 'RemoteStatus', 'posted': 'Posted_date', 'url': 'JobURL',
+        'scraped_at': 'Current date time (CST)',
+    },
+    'Indeed': {
+        'job_id': 'Job ID', 'title': 'Title', 'company': 'Company', 'location': 'Location', 'pay': 'Salary',
+        'job_type': 'Job Type', 'work_type': 'Remote / Hybrid', 'posted': 'Date Posted', 'url': 'Job Link',
+        'scraped_at': 'Current Date Time',
+    },
+    'CareerBuilder': {
+        'job_id': 'Job_id', 'title': 'Title', 'company': 'Company', 'location': 'Location', 'pay': 'Salary',
+        'job_type': 'Job_type', 'work_type': 'Work Location', 'posted': 'Date Posted', 'url': 'Job_url',
+        'scraped_at': 'Current Date',
+    },
+    'Dice': {
+        'job_id': 'Job_id', 'title': 'Job title', 'company': 'Vendor company name', 'location': 'Job location', 'pay': 'Pay rate',
+        'job_type': 'Job type', 'work_type': 'Work type(remote/on-site)', 'posted': 'Job posting date', 'url': 'Job posting url',
+        'scraped_at': 'Current date time (CST)',
+    },
+}
+
+# Job ID in the link of portals whose older files have no ID column, the same rule the scraper uses
+URL_JOB_ID_PATTERNS = {
+    'ZipRecruiter': r'jid=([^&]*)',
+}
+
+# Older Dice and ZipRecruiter files name the scrape time column differently
+LEGACY_COLUMNS = {
+    'ZipRecruiter': {'Current_Date_Time': 'Current date time (CST)'},
+    'Dice': {'Current date time': 'Current date time (CST)'},
+}
+
+
+# Map a whole portal output frame onto the canonical columns plus the normalized pay and posted time
+def to_frame(dataframe, portal):
+    dataframe = dataframe.rename(columns=LEGACY_COLUMNS.get(portal, {}))
+    columns = PORTAL_FIELDS[portal]
+    frame = pd.DataFrame({
+        field: dataframe[column] if column in dataframe.columns else pd.Series(pd.NA, index=dataframe.index, dtype='string')
+        for field, column in columns.items()
+    })
+    frame.insert(0, 'portal', portal)
+    if portal in URL_JOB_ID_PATTERNS:
+        frame['job_id'] = frame['job_id'].fillna(frame['url'].astype('string').str.extract(URL_JOB_ID_PATTERNS[portal], expand=False))
+    frame['work_type'] = work_type(frame['work_type'])
+    return compact(normalize(frame, portal))
+
+
+# Store low-cardinality fields as categoricals and the rest as strings
+def compact(frame):
+    for field in frame.columns:
+        if field in CATEGORICAL_FIELDS:
+            frame[field] = frame[field].astype('category')
+        elif field in FIELDS:
+            frame[field] = frame[field].astype('string')
+    return frame
+
+
+# Load the four portal outputs of one or more day folders into a single canonical frame
+def load_outputs(directories):
+    frames = []
+    for directory in directories:
+        for portal, filename in Config.portal_output_files.items():
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                continue
+            frame = to_frame(pd.read_csv(path, dtype=str), portal)
+            frame['day'] = os.path.basename(os.path.normpath(directory))
+            frames.append(frame)
+
+    if not frames:
+        return compact(pd.DataFrame(columns=list(FIELDS) + list(NORMALIZED_FIELDS) + ['day']))
+
+    # Categories differ per file, so they are merged back into categoricals after concatenating
+    combined = pd.concat(frames, ignore_index=True)
+    combined['day'] = combined['day'].astype('category')
+    return compact(combined)
+
+
+# Write the canonical, normalized jobs of the given day folders (every day folder by default), one file per day
+def main(directories=None):
+    directories = directories or sorted(path for path in glob.glob(os.path.join(Config.output_directory, '*')) if os.path.isdir(path) and os.path.basename(path)[:1].isdigit())
+    start = time.perf_counter()
+    rows = 0
+    for directory in directories:
+        frame = load_outputs([directory])
+        if frame.empty:
+            continue
+        frame.to_csv(os.path.join(directory, Config.output_csv_normalized), index=False)
+        rows += len(frame)
+        print(f'{directory}: {len(frame)} jobs normalized')
+    print(f'Normalized {rows} jobs from {len(directories)} day folders in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,26 +1,23 @@
 # main.py
 
-from zipRecruiter import Wrapper as ZipRecruiterWrapper
-from indeed import IndeedScraper
-from career_builder import CareerBuilderScraper
-from dice import Wrapper as DiceWrapper
+import argparse
 
-def main():
-    # Run ZipRecruiter scraper
-    zip_recruiter_wrapper = ZipRecruiterWrapper()
-    zip_recruiter_wrapper.run()
+from config import Config
+from functools import partial
+from portals import PORTALS, load_scraper
+from orchestrator import Orchestrator
 
-    # Run Indeed scraper
-    indeed_scraper = IndeedScraper()
-    indeed_scraper.run()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scrape contract jobs from the Job Portals')
+    parser.add_argument('--portals', nargs='+', default=list(PORTALS), choices=list(PORTALS), help='portals to run, all by default')
+    parser.add_argument('--keywords', nargs='+', default=Config.keywords, help='search keywords, Config.keywords by default')
+    args = parser.parse_args(argv)
+    Config.keywords = args.keywords
 
-    # Run CareerBuilder scraper
-    career_builder_scraper = CareerBuilderScraper()
-    career_builder_scraper.run()
-
-    # Run Dice scraper
-    dice_wrapper = DiceWrapper()
-    dice_wrapper.run()
+    # Run the selected portal scrapers in parallel, a failure in one portal does not stop the others.
+    # Each scraper module is imported by its own portal thread, so unselected portals cost nothing
+    orchestrator = Orchestrator([(portal, partial(load_scraper, portal)) for portal in args.portals])
+    return orchestrator.run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,289 @@
+# metrics.py per-stage timings and counters of a scraper run, reported as JSON and as a Prometheus textfile
+
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+from config import Config
+from datetime import datetime
+from contextlib import contextmanager
+
+# Stages every page goes through
+STAGES = ('fetch', 'parse', 'transform', 'write')
+
+
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        # (portal, keyword, page, stage) -> [calls, seconds, max seconds]
+        self.timings = {}
+        # (portal, status code) -> responses
+        self.statuses = {}
+        # (name, portal, keyword) -> total, e.g. bytes_downloaded or rows_parsed
+        self.counters = {}
+        # portal -> outcome reported by the orchestrator
+        self.portals = {}
+        # Extra report sections (name -> function returning the section), e.g. the proxy health
+        self.sections = {}
+
+    # Label everything recorded on this thread with a portal, keyword and page
+    @contextmanager
+    def page(self, portal, keyword=None, page=None):
+        previous = getattr(self.local, 'labels', None)
+        self.local.labels = (portal, keyword, page)
+        try:
+            yield
+        finally:
+            self.local.labels = previous
+
+    def labels(self, portal=None):
+        current_portal, keyword, page = getattr(self.local, 'labels', None) or (None, None, None)
+        if portal is not None and portal != current_portal:
+            return portal, None, None
+        return current_portal, keyword, page
+
+    # Time a stage of the current page
+    @contextmanager
+    def stage(self, name, portal=None):
+        labels = self.labels(portal)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(labels, name, time.perf_counter() - start)
+
+    def add_time(self, labels, stage, seconds):
+        with self.lock:
+            timing = self.timings.setdefault(labels + (stage,), [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def count(self, name, value, portal=None):
+        portal, keyword, _ = self.labels(portal)
+        with self.lock:
+            key = (name, portal, keyword)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Status code and size of a response, cached responses are counted but not as downloaded bytes
+    def record_response(self, portal, response):
+        with self.lock:
+            key = (portal, response.status_code)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+        if getattr(response, 'from_cache', False):
+            self.count('cache_hits', 1, portal)
+        else:
+            self.count('bytes_downloaded', len(response.content or b''), portal)
+
+    def portal_finished(self, result):
+        with self.lock:
+            self.portals[result.name] = {'ok': result.ok, 'seconds': round(result.elapsed, 3), 'error': result.error}
+
+    # Add a section to the report, its function is called each time the report is built
+    def add_section(self, name, source):
+        with self.lock:
+            self.sections[name] = source
+
+    def report(self):
+        with self.lock:
+            sections = dict(self.sections)
+            timings = dict(self.timings)
+            statuses = dict(self.statuses)
+            counters = dict(self.counters)
+            outcomes = dict(self.portals)
+
+        portals = {}
+
+        def entry(portal):
+            return portals.setdefault(portal or 'unknown', dict(outcomes.get(portal, {}), stages={}, http_status={}, keywords={}))
+
+        def add_stage(stages, stage, calls, seconds, longest):
+            total = stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            total['calls'] += calls
+            total['seconds'] = round(total['seconds'] + seconds, 6)
+            total['max_seconds'] = round(max(total['max_seconds'], longest), 6)
+
+        for (portal, keyword, page, stage), (calls, seconds, longest) in timings.items():
+            portal_entry = entry(portal)
+            add_stage(portal_entry['stages'], stage, calls, seconds, longest)
+            if keyword is not None:
+                keyword_entry = portal_entry['keywords'].setdefault(keyword, {'stages': {}, 'pages': {}})
+                add_stage(keyword_entry['stages'], stage, calls, seconds, longest)
+                if page is not None:
+                    keyword_entry['pages'].setdefault(str(page), {})[stage] = round(seconds, 6)
+
+        for (portal, status), responses in statuses.items():
+            entry(portal)['http_status'][str(status)] = responses
+
+        for (name, portal, keyword), value in counters.items():
+            portal_entry = entry(portal)
+            portal_entry[name] = portal_entry.get(name, 0) + value
+            if keyword is not None:
+                keyword_entry = portal_entry['keywords'].setdefault(keyword, {'stages': {}, 'pages': {}})
+                keyword_entry[name] = keyword_entry.get(name, 0) + value
+
+        for portal in outcomes:
+            entry(portal)
+
+        finished = time.time()
+        return {
+            'run_date': Config.subdirectory,
+            'started_at': datetime.fromtimestamp(self.started).strftime('%Y-%m-%dT%H:%M:%S'),
+            'finished_at': datetime.fromtimestamp(finished).strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': round(finished - self.started, 3),
+            'portals': portals,
+            **{name: source() for name, source in sections.items()},
+        }
+
+    # Portal level totals in the Prometheus text exposition format, for the node exporter textfile collector
+    def prometheus(self, report):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP job_scraper_{name} {help_text}')
+            lines.append(f'# TYPE job_scraper_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{str(label).replace(chr(34), "")}"' for key, label in labels.items())
+                lines.append(f'job_scraper_{name}{{{label_text}}} {value}')
+
+        # Every value is of the last run only, so they are gauges and carry no _total suffix
+        portals = report['portals']
+        metric('stage_seconds', 'gauge', 'Time spent in each stage of the last run',
+               [({'portal': portal, 'stage': stage}, totals['seconds']) for portal, data in portals.items() for stage, totals in data['stages'].items()])
+        metric('stage_calls', 'gauge', 'Times each stage ran in the last run',
+               [({'portal': portal, 'stage': stage}, totals['calls']) for portal, data in portals.items() for stage, totals in data['stages'].items()])
+        metric('http_responses', 'gauge', 'HTTP responses of the last run by status code',
+               [({'portal': portal, 'status': status}, count) for portal, data in portals.items() for status, count in data['http_status'].items()])
+        for name, help_text in (('bytes_downloaded', 'Response bytes downloaded'), ('cache_hits', 'Responses served from the cache'),
+                                ('rows_parsed', 'Rows parsed from pages'), ('rows_written', 'Rows written to the output after filtering'),
+                                ('retries', 'Requests retried after a transient error'), ('blocked_responses', 'Block pages received'),
+                                ('skipped_requests', 'Requests not sent because the portal circuit was open')):
+            metric(name, 'gauge', f'{help_text} in the last run', [({'portal': portal}, data.get(name, 0)) for portal, data in portals.items()])
+        metric('portal_success', 'gauge', '1 if the portal finished without an error',
+               [({'portal': portal}, int(data['ok'])) for portal, data in portals.items() if 'ok' in data])
+        metric('portal_duration_seconds', 'gauge', 'Wall time of each portal',
+               [({'portal': portal}, data['seconds']) for portal, data in portals.items() if 'seconds' in data])
+        lines.append('# HELP job_scraper_last_run_timestamp_seconds When the last run finished')
+        lines.append('# TYPE job_scraper_last_run_timestamp_seconds gauge')
+        lines.append(f'job_scraper_last_run_timestamp_seconds {time.time():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the JSON run report and replace the Prometheus textfile, returns the report path
+    def write_report(self):
+        report = self.report()
+        os.makedirs(Config.metrics_directory, exist_ok=True)
+        report_path = os.path.join(Config.metrics_directory, f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        # The collector may read at any moment, so the textfile is swapped in atomically
+        os.makedirs(os.path.dirname(Config.metrics_textfile) or '.', exist_ok=True)
+        temp_path = f'{Config.metrics_textfile}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus(report))
+        os.replace(temp_path, Config.metrics_textfile)
+
+        print(f'Run report saved to {report_path}')
+        return report_path
+
+
+# Profilers of each portal being profiled, the calling thread's first and then one per profile_call()
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+# cProfile the calling thread when Config.profile_mode is "cprofile", the stats go to <metrics_directory>/profile-<name>.prof.
+# cProfile only sees the thread it runs on, so the work a portal hands to its worker threads is profiled with
+# profile_call() and merged into the same file
+@contextmanager
+def profile_thread(name):
+    if Config.profile_mode != 'cprofile':
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    with _profiles_lock:
+        _profiles[name] = [profiler]
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _profiles_lock:
+            profilers = _profiles.pop(name)
+        stats = pstats.Stats(profilers[0])
+        for worker_profiler in profilers[1:]:
+            stats.add(worker_profiler)
+        os.makedirs(Config.metrics_directory, exist_ok=True)
+        path = os.path.join(Config.metrics_directory, f'profile-{name}.prof')
+        stats.dump_stats(path)
+        print(f'Profile for {name} saved to {path}, view it with: python -m pstats {path}')
+
+
+# Run function(*args) on a worker thread of a portal, profiled into the portal's profile while profile_thread() records it
+def profile_call(name, function, *args):
+    with _profiles_lock:
+        profilers = _profiles.get(name)
+    if profilers is None:
+        return function(*args)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        with _profiles_lock:
+            profilers.append(profiler)
+
+
+# Trace allocations of the whole run when Config.profile_mode is "tracemalloc" and save the top allocation sites
+@contextmanager
+def trace_memory(top=30):
+    if Config.profile_mode != 'tracemalloc':
+        yield
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        os.makedirs(Config.metrics_directory, exist_ok=True)
+        path = os.path.join(Config.metrics_directory, 'tracemalloc.txt')
+        with open(path, 'w') as f:
+            f.write(f'Peak traced memory: {peak / 1024 / 1024:.1f} MB\n')
+            for stat in snapshot.statistics('lineno')[:top]:
+                f.write(f'{stat}\n')
+        print(f'Allocation report saved to {path}')
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Return the metrics of the current run, shared by all scrapers
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = RunMetrics()
+        return _metrics
+
+
+# Start empty metrics for a new run, so a long-lived process does not add up its runs. Report sections stay
+# registered, their sources (e.g. the proxy pool) outlive a run
+def reset_metrics():
+    global _metrics
+    with _metrics_lock:
+        sections = _metrics.sections if _metrics is not None else {}
+        _metrics = RunMetrics()
+        _metrics.sections.update(sections)
+        return _metrics
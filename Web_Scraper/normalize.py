@@ -0,0 +1,125 @@
+# normalize.py vectorized normalization of pay, posted time and work type across the Job Portals
+
+import numpy as np
+import pandas as pd
+
+from run_clock import UTC, CST
+
+# One amount of a pay text: optional currency marks, the number and an optional thousands K
+AMOUNT = r'(?:USD|\$)*\s*(-?\d[\d,]*(?:\.\d+)?)\s*([kK])?'
+
+# A single amount or a low - high range, e.g. "$41.37 - $48.27 / hr", "USD70 - USD75" or "USD 99-99"
+PAY_PATTERN = rf'{AMOUNT}(?:\s*(?:-|to)\s*{AMOUNT})?'
+
+# Columns normalize() adds to a canonical frame
+NORMALIZED_FIELDS = ('pay_min', 'pay_max', 'pay_unit', 'posted_utc')
+
+# Pay period wording of each portal mapped to one unit, longest spellings first
+PAY_UNITS = {
+    'hour': r'hourly|hours?|hrs?',
+    'day': r'daily|days?',
+    'week': r'weekly|weeks?|wk',
+    'month': r'monthly|months?|mo',
+    'year': r'yearly|years?|yr|annual(?:ly)?|annum',
+}
+PAY_UNIT_PATTERN = r'(?i)(?:^|[^a-z])(' + '|'.join(PAY_UNITS.values()) + r')(?![a-z])'
+
+# Pays without a period are taken as hourly up to this amount and yearly from the second one on
+HOURLY_PAY_LIMIT = 500
+YEARLY_PAY_FLOOR = 10000
+
+# Portals that stamp their posted time with the scrape time in US Central time instead of a UTC time.
+# "all" means every value, "Z" only the values ending in Z (older Indeed files hold UTC times without it)
+CENTRAL_TIME_POSTED = {
+    'Indeed': 'Z',
+    'CareerBuilder': 'all',
+}
+
+# Each portal's work type wording mapped to one vocabulary
+WORK_TYPES = {
+    'remote': 'Remote',
+    'hybrid': 'Hybrid',
+    'on-site': 'On-site',
+    'onsite': 'On-site',
+    'hybrid/on site': 'Hybrid/On-site',
+    'hybrid/onsite': 'Hybrid/On-site',
+}
+
+
+# Turn a column of pay texts into pay_min, pay_max (floats) and pay_unit. A range missing one bound (Indeed writes
+# "$0.00 - $85.00" for a fixed pay) has the other as both, open ranges like "$99+" only have a minimum and
+# "Up to $99" only a maximum, texts without a number ("Depends on Experience") stay empty
+def parse_pay(pay):
+    text = pay.astype('string').str.strip()
+    amounts = text.str.extract(PAY_PATTERN)
+
+    def amount(number, thousands):
+        value = pd.to_numeric(number.str.replace(',', '', regex=False), errors='coerce').astype('float64')
+        value = value.where(thousands.isna(), value * 1000)
+        # Portals use 0 and negative numbers for a missing bound
+        return value.where(value > 0)
+
+    low = amount(amounts[0], amounts[1])
+    high = amount(amounts[2], amounts[3])
+
+    up_to = text.str.contains(r'(?i)\bup to\b', na=False) & high.isna()
+    open_ended = text.str.contains('+', regex=False, na=False) & high.isna()
+    pay_min = low.fillna(high).mask(up_to)
+    pay_max = high.fillna(low).mask(open_ended)
+
+    words = text.str.extract(PAY_UNIT_PATTERN, expand=False).str.lower()
+    conditions = [words.str.fullmatch(pattern, na=False).to_numpy(dtype=bool) for pattern in PAY_UNITS.values()]
+    unit = pd.Series(np.select(conditions, list(PAY_UNITS), default=None), index=pay.index, dtype='object')
+
+    # No period given, judge it by the size of the pay
+    top = pay_max.fillna(pay_min)
+    guessed = np.select([(top < HOURLY_PAY_LIMIT).to_numpy(), (top >= YEARLY_PAY_FLOOR).to_numpy()], ['hour', 'year'], default=None)
+    unit = unit.fillna(pd.Series(guessed, index=pay.index, dtype='object'))
+
+    return pd.DataFrame({'pay_min': pay_min, 'pay_max': pay_max, 'pay_unit': unit}, index=pay.index)
+
+
+# Turn a column of posted times of a portal into UTC timestamps, unparseable values become NaT
+def posted_utc(posted, portal):
+    text = posted.astype('string').str.strip()
+    stamps = pd.to_datetime(text.str.rstrip('Z'), errors='coerce', format='mixed')
+    if stamps.dt.tz is not None:
+        stamps = stamps.dt.tz_convert(UTC).dt.tz_localize(None)
+
+    rule = CENTRAL_TIME_POSTED.get(portal)
+    as_utc = stamps.dt.tz_localize(UTC)
+    if rule is None:
+        return as_utc
+
+    as_central = stamps.dt.tz_localize(CST, ambiguous='NaT', nonexistent='NaT').dt.tz_convert(UTC)
+    if rule == 'all':
+        return as_central
+    return as_central.where(text.str.endswith('Z').fillna(False), as_utc)
+
+
+# Map a column of work types onto the shared vocabulary, values it does not know become missing
+def work_type(values):
+    return values.astype('string').str.strip().str.lower().map(WORK_TYPES)
+
+
+# Turn a column of relative posted dates ("Today", "Yesterday", "3 days ago") into dates counted back from today,
+# anything else ("30+ days ago") becomes missing
+def relative_dates(relative_date, today):
+    text = relative_date.astype('string').fillna('')
+    days_ago = pd.to_numeric(text.str.extract(r'^\s*(\d+)\s+days? ago', expand=False), errors='coerce').astype('float64')
+    days_ago = pd.Series(np.select(
+        [text.str.contains('today', case=False).to_numpy(dtype=bool), text.str.contains('yesterday', case=False).to_numpy(dtype=bool)],
+        [0, 1],
+        default=days_ago,
+    ), index=text.index)
+    dates = pd.Timestamp(today) - pd.to_timedelta(days_ago, unit='D')
+    return dates.dt.date.where(dates.notna(), None)
+
+
+# Add pay_min, pay_max, pay_unit and posted_utc to a canonical frame of one portal
+def normalize(frame, portal):
+    pay = parse_pay(frame['pay'])
+    for column in pay.columns:
+        frame[column] = pay[column]
+    frame['posted_utc'] = posted_utc(frame['posted'], portal)
+    return frame
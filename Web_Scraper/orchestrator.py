@@ -0,0 +1,60 @@
+# orchestrator.py for running the Job Portals in parallel
+
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from metrics import get_metrics, profile_thread, trace_memory
+from run_clock import start_run
+
+
+class PortalResult:
+    def __init__(self, name, ok, elapsed, error=None):
+        self.name = name
+        self.ok = ok
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'failed ({self.error})'
+        return f'{self.name}: {status} in {self.elapsed:.1f}s'
+
+
+class Orchestrator:
+    # portals is a list of (name, factory) pairs, the factory builds a scraper with a run() method
+    def __init__(self, portals):
+        self.portals = portals
+
+    # Run a single portal and capture its outcome instead of raising
+    def run_portal(self, name, factory):
+        start = time.perf_counter()
+        try:
+            with profile_thread(name):
+                scraper = factory()
+                scraper.run()
+            result = PortalResult(name, True, time.perf_counter() - start)
+        except Exception as e:
+            print(f'{name} scraper failed: {e}')
+            traceback.print_exc()
+            result = PortalResult(name, False, time.perf_counter() - start, error=repr(e))
+
+        get_metrics().portal_finished(result)
+        return result
+
+    # Run all portals at the same time, wait for every one of them to finish and save the run report
+    def run(self):
+        if not self.portals:
+            return []
+
+        # Every portal stamps its rows with the time this run started
+        start_run()
+        with trace_memory():
+            with ThreadPoolExecutor(max_workers=len(self.portals), thread_name_prefix='portal') as executor:
+                futures = [executor.submit(self.run_portal, name, factory) for name, factory in self.portals]
+                results = [future.result() for future in futures]
+
+        for result in results:
+            print(result)
+
+        get_metrics().write_report()
+        return results
@@ -0,0 +1,221 @@
+# output_writer.py writes each portal's results as CSV and, optionally, partitioned Parquet
+#
+# The CSVs keep each portal's own columns. The Parquet files hold the canonical fields of job_record instead, all
+# with the same schema, so the whole folder reads as one table:
+#     pd.read_parquet(Config.parquet_directory)
+# Partitions written by an older version are rewritten with: python output_writer.py output/<day> ...
+
+import os
+import sys
+import uuid
+import shutil
+import glob
+import pandas as pd
+
+from config import Config
+from metrics import get_metrics
+from job_record import CATEGORICAL_FIELDS, FIELDS, NORMALIZED_FIELDS, to_frame
+
+# Arrow type of every Parquet column. portal and date come from the partition folders, low-cardinality fields
+# are dictionaries with int32 indices in every file, pay and dates are typed and everything else is text
+PARQUET_TYPES = {
+    'pay_min': 'float64',
+    'pay_max': 'float64',
+    'posted_utc': 'timestamp[us, tz=UTC]',
+    # The scrape time as the portal's scraper wrote it, without a time zone
+    'scraped_at': 'timestamp[us]',
+}
+PARQUET_COLUMNS = [field for field in FIELDS + NORMALIZED_FIELDS if field != 'portal']
+
+
+# Folder of one portal/day partition, hive style so pd.read_parquet(Config.parquet_directory) restores both columns
+def partition_path(portal, day=None):
+    return os.path.join(Config.parquet_directory, f'portal={portal}', f'date={day or Config.subdirectory}')
+
+
+# The fixed schema every Parquet file is written with
+def parquet_schema():
+    import pyarrow as pa
+    types = {'float64': pa.float64(), 'timestamp[us, tz=UTC]': pa.timestamp('us', tz='UTC'), 'timestamp[us]': pa.timestamp('us')}
+    return pa.schema([
+        (field, types[PARQUET_TYPES[field]] if field in PARQUET_TYPES
+         else pa.dictionary(pa.int32(), pa.string()) if field in CATEGORICAL_FIELDS else pa.string())
+        for field in PARQUET_COLUMNS
+    ])
+
+
+# Map a portal's output onto the canonical fields of the Parquet schema, empty cells become missing values
+def prepare_for_parquet(dataframe, portal):
+    frame = to_frame(dataframe.mask(dataframe == ''), portal)
+    scraped_at = frame['scraped_at'].astype('string').str.rstrip('Z')
+    frame['scraped_at'] = pd.to_datetime(scraped_at, errors='coerce', format='mixed')
+    return frame[PARQUET_COLUMNS]
+
+
+# Write a frame of the Parquet columns, cast to the fixed schema
+def write_parquet(frame, path):
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        frame = frame.astype({column: 'string' for column in frame.select_dtypes('category').columns})
+        table = pa.Table.from_pandas(frame[PARQUET_COLUMNS], schema=parquet_schema(), preserve_index=False)
+        pq.write_table(table, temp_path, compression=Config.parquet_compression)
+    except ImportError as e:
+        print(f'Sorry, Parquet output needs pyarrow installed: {e}')
+        return False
+    os.replace(temp_path, path)
+    return True
+
+
+def parquet_enabled():
+    return 'parquet' in Config.output_formats
+
+
+class StreamingWriter:
+    # Results are flushed to part files as each page arrives, so memory does not grow with pages x keywords.
+    # The parts go to a fresh scratch folder unless a directory is given, e.g. by a checkpoint that outlives the process
+    def __init__(self, portal, directory=None):
+        self.portal = portal
+        self.directory = directory or os.path.join(Config.streaming_directory, f'{portal}-{uuid.uuid4().hex[:8]}')
+        os.makedirs(self.directory, exist_ok=True)
+        self.parts = []
+
+    # Flush one page (or keyword) of results, returns the part file or None when there was nothing to write
+    def write(self, dataframe, name=None):
+        if dataframe is None or dataframe.empty:
+            return None
+        metrics = get_metrics()
+        path = os.path.join(self.directory, name or f'part-{len(self.parts):05d}.csv')
+        with metrics.stage('write', self.portal):
+            dataframe.to_csv(path, index=False)
+        self.parts.append(path)
+        metrics.count('rows_parsed', len(dataframe), self.portal)
+        return path
+
+    # Take over a part file written elsewhere, e.g. a task result of the work queue
+    def add_part(self, path):
+        self.parts.append(path)
+
+    # Columns of all parts in order of first appearance, pages with a missing field still line up
+    def columns(self):
+        columns = []
+        for path in self.parts:
+            for column in pd.read_csv(path, nrows=0).columns:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    # Stream the parts once: drop excluded rows and duplicates, then atomically replace the day's output.
+    # exclude maps a column to a value to leave out, returns the values of id_column that were written.
+    # keep_parts leaves the parts in place for a later finalize, e.g. of a checkpoint that is not done yet
+    def finalize(self, exclude=None, id_column=None, keep_parts=False):
+        if not self.parts:
+            print(f'Sorry, no {self.portal} data was collected, keeping the existing output')
+            if not keep_parts:
+                self.cleanup()
+            return []
+
+        with get_metrics().stage('write', self.portal):
+            written_ids, written_rows = self.merge_parts(exclude, id_column, keep_parts)
+        get_metrics().count('rows_written', written_rows, self.portal)
+        print(f'Saved {written_rows} {self.portal} jobs')
+        return written_ids
+
+    # The single pass over the parts behind finalize, returns the written IDs and the number of rows
+    def merge_parts(self, exclude, id_column, keep_parts=False):
+        columns = self.columns()
+        seen_rows = set()
+        written_ids = []
+        parquet_parts = []
+
+        os.makedirs(Config.output_csv_path1, exist_ok=True)
+        output_path = os.path.join(Config.output_csv_path1, Config.portal_output_files[self.portal])
+        temp_path = os.path.join(Config.output_csv_path1, f'.{Config.portal_output_files[self.portal]}.{uuid.uuid4().hex[:8]}.tmp')
+        if parquet_enabled():
+            os.makedirs(partition_path(self.portal), exist_ok=True)
+
+        for position, path in enumerate(self.parts):
+            chunk = pd.read_csv(path, dtype=str, keep_default_na=False).reindex(columns=columns, fill_value='')
+            for column, value in (exclude or {}).items():
+                chunk = chunk[chunk[column] != value]
+
+            row_hashes = pd.util.hash_pandas_object(chunk, index=False)
+            keep = ~row_hashes.duplicated() & ~row_hashes.isin(seen_rows)
+            chunk = chunk[keep.values]
+            seen_rows.update(row_hashes[keep].tolist())
+
+            if 'csv' in Config.output_formats:
+                chunk.to_csv(temp_path, mode='a', header=position == 0, index=False)
+            if parquet_enabled() and not chunk.empty:
+                part_path = os.path.join(partition_path(self.portal), f'part-{uuid.uuid4().hex}.parquet')
+                if write_parquet(prepare_for_parquet(chunk, self.portal), part_path):
+                    parquet_parts.append(part_path)
+            if id_column is not None:
+                written_ids.extend(chunk[id_column].tolist())
+
+        if 'csv' in Config.output_formats:
+            os.replace(temp_path, output_path)
+        if parquet_parts:
+            compact_partition(self.portal, parts=parquet_parts)
+
+        if not keep_parts:
+            self.cleanup()
+        return written_ids, len(seen_rows)
+
+    def cleanup(self):
+        for path in self.parts:
+            os.remove(path)
+        # Parts of units that never finished may be left over in a checkpoint folder
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.parts = []
+
+
+def remove_parts(partition):
+    for part in glob.glob(os.path.join(partition, 'part-*.parquet')):
+        os.remove(part)
+
+
+# Merge the small part files of a partition into a single data.parquet. With parts given only those
+# files replace the partition's data, otherwise every part is merged into the existing data file
+def compact_partition(portal, day=None, parts=None):
+    if not parquet_enabled():
+        return
+
+    partition = partition_path(portal, day)
+    data_path = os.path.join(partition, 'data.parquet')
+    if parts is None:
+        parts = sorted(glob.glob(os.path.join(partition, 'part-*.parquet')))
+        existing = [data_path] if os.path.exists(data_path) else []
+    else:
+        existing = []
+    if not parts:
+        return
+
+    frames = [pd.read_parquet(path) for path in existing + parts]
+    # Read back as plain values so categories from different parts can be merged
+    merged = pd.concat([frame.astype({column: 'string' for column in frame.select_dtypes('category').columns}) for frame in frames], ignore_index=True)
+
+    if write_parquet(merged, data_path):
+        for part in parts:
+            os.remove(part)
+
+
+# Convert the CSVs of existing day folders into Parquet partitions, e.g. to backfill history
+def convert_days(directories):
+    for directory in directories:
+        day = os.path.basename(os.path.normpath(directory))
+        for portal, filename in Config.portal_output_files.items():
+            csv_path = os.path.join(directory, filename)
+            if not os.path.exists(csv_path):
+                continue
+            partition = partition_path(portal, day)
+            os.makedirs(partition, exist_ok=True)
+            remove_parts(partition)
+            frame = prepare_for_parquet(pd.read_csv(csv_path, dtype=str), portal)
+            if write_parquet(frame, os.path.join(partition, 'data.parquet')):
+                print(f'Converted {csv_path}')
+
+
+if __name__ == "__main__":
+    convert_days(sys.argv[1:])
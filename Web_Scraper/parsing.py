@@ -0,0 +1,66 @@
+# parsing.py HTML parsing helpers shared by the Job Portals
+
+import re
+import html
+
+from config import Config
+from functools import lru_cache
+from bs4 import BeautifulSoup, FeatureNotFound
+
+
+# Pick the fastest available parser, falling back to the built-in html.parser
+def resolve_parser():
+    for parser in (Config.html_parser, 'html.parser'):
+        try:
+            BeautifulSoup('', parser)
+            return parser
+        except FeatureNotFound:
+            continue
+    return 'html.parser'
+
+
+HTML_PARSER = resolve_parser()
+
+
+# Parse a page with the preferred parser
+def make_soup(markup, parse_only=None):
+    return BeautifulSoup(markup, HTML_PARSER, parse_only=parse_only)
+
+
+@lru_cache(maxsize=None)
+def script_pattern(script_id):
+    return re.compile(
+        rb'<script\b[^>]*\bid\s*=\s*["\']?' + re.escape(script_id.encode()) + rb'(?=["\'\s/>])[^>]*>(.*?)</script\s*>',
+        re.DOTALL | re.IGNORECASE,
+    )
+
+
+@lru_cache(maxsize=None)
+def tag_in_class_pattern(container_class, tag):
+    return re.compile(
+        rb'<[a-z0-9]+\b[^>]*\bclass\s*=\s*["\'][^"\']*\b' + re.escape(container_class.encode()) + rb'\b[^"\']*["\'][^>]*>'
+        rb'.*?<' + tag.encode() + rb'\b[^>]*>(.*?)</' + tag.encode() + rb'\s*>',
+        re.DOTALL | re.IGNORECASE,
+    )
+
+
+# Pull the body of <script id="script_id"> straight out of the raw page without building a DOM,
+# returns None when the script is not there so callers can fall back to a full parse
+def extract_script(content, script_id):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    match = script_pattern(script_id).search(content)
+    if not match:
+        return None
+    return match.group(1).decode('utf-8', errors='replace')
+
+
+# Text of the first <tag> inside an element with container_class, stripped like get_text(strip=True)
+def extract_tag_text(content, container_class, tag):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    match = tag_in_class_pattern(container_class, tag).search(content)
+    if not match:
+        return None
+    inner = match.group(1).decode('utf-8', errors='replace')
+    return ''.join(html.unescape(piece).strip() for piece in re.split(r'<[^>]+>', inner))
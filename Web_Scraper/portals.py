@@ -0,0 +1,23 @@
+# portals.py registry of the Job Portal scrapers, a scraper module (and pandas, bs4 and the rest it needs) is
+# only imported once its portal is run
+
+import importlib
+
+# Module and class of every portal's scraper, in the order portals are run
+PORTALS = {
+    'ZipRecruiter': ('zipRecruiter', 'Wrapper'),
+    'Indeed': ('indeed', 'IndeedScraper'),
+    'CareerBuilder': ('career_builder', 'CareerBuilderScraper'),
+    'Dice': ('dice', 'Wrapper'),
+}
+
+
+# Import a portal's scraper class
+def scraper_class(portal):
+    module_name, class_name = PORTALS[portal]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+# Build a portal's scraper
+def load_scraper(portal):
+    return scraper_class(portal)()
@@ -0,0 +1,144 @@
+# proxy_pool.py spreads requests over several proxy endpoints, picking them by health per portal
+
+import time
+import random
+import threading
+
+from config import Config
+from metrics import get_metrics
+from resilience import is_blocked
+
+# Outcomes of a request through a proxy
+OK = 'ok'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+
+class ProxyStats:
+    # Moving averages of one proxy, for one portal or (portal None) for every portal together
+    def __init__(self):
+        self.latency = None
+        self.success_rate = 1.0
+        self.block_rate = 0.0
+        self.requests = 0
+        self.failures_in_row = 0
+        self.cooldown_until = 0.0
+
+    def record(self, seconds, outcome, now):
+        alpha = Config.proxy_score_alpha
+        self.requests += 1
+        if outcome != FAILED:
+            self.latency = seconds if self.latency is None else (1 - alpha) * self.latency + alpha * seconds
+        self.success_rate = (1 - alpha) * self.success_rate + alpha * (outcome == OK)
+        self.block_rate = (1 - alpha) * self.block_rate + alpha * (outcome == BLOCKED)
+
+        if outcome == OK:
+            self.failures_in_row = 0
+            self.cooldown_until = 0.0
+        else:
+            # Cool down for longer with every failure in a row
+            self.failures_in_row += 1
+            cooldown = min(Config.proxy_max_cooldown_seconds, Config.proxy_cooldown_seconds * 2 ** (self.failures_in_row - 1))
+            self.cooldown_until = now + cooldown
+
+    # Higher is better: fast proxies that answer and are not blocked, an unused proxy counts as healthy
+    def score(self):
+        latency = self.latency if self.latency is not None else Config.proxy_default_latency
+        return self.success_rate * (1 - self.block_rate) / max(latency, 0.05)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'latency': None if self.latency is None else round(self.latency, 3),
+            'success_rate': round(self.success_rate, 3),
+            'block_rate': round(self.block_rate, 3),
+        }
+
+
+class ProxyPool:
+    # A block only cools a proxy down for the portal that blocked it, a failed request (connection error,
+    # timeout or error status) cools it down for every portal
+    def __init__(self, proxies=None):
+        self.proxies = list(proxies or Config.proxies)
+        # (proxy, portal) -> ProxyStats, portal None holds the totals of a proxy
+        self.stats = {}
+        self.in_flight = {proxy: 0 for proxy in self.proxies}
+        self.lock = threading.Lock()
+
+    def entry(self, proxy, portal):
+        stats = self.stats.get((proxy, portal))
+        if stats is None:
+            stats = self.stats[(proxy, portal)] = ProxyStats()
+        return stats
+
+    # Pick the healthiest proxy for a portal that is not cooling down, shared out by the requests each has in flight.
+    # When every proxy cools down the one that is ready first is used
+    def acquire(self, portal=None):
+        with self.lock:
+            now = time.monotonic()
+            ready, cooling = [], []
+            for proxy in self.proxies:
+                overall, for_portal = self.entry(proxy, None), self.entry(proxy, portal)
+                cooldown_until = max(overall.cooldown_until, for_portal.cooldown_until)
+                if cooldown_until > now:
+                    cooling.append((cooldown_until, proxy))
+                    continue
+                stats = for_portal if for_portal.requests else overall
+                # Random tie-break so equally healthy proxies share the load
+                ready.append((stats.score() / (1 + self.in_flight[proxy]), random.random(), proxy))
+
+            proxy = max(ready)[2] if ready else min(cooling)[1]
+            self.in_flight[proxy] += 1
+            return proxy
+
+    def release(self, proxy, portal, seconds, outcome):
+        with self.lock:
+            self.in_flight[proxy] -= 1
+            now = time.monotonic()
+            self.entry(proxy, portal).record(seconds, outcome, now)
+            if outcome != BLOCKED and portal is not None:
+                self.entry(proxy, None).record(seconds, outcome, now)
+
+    # Health of every proxy, overall and per portal, for the run report
+    def snapshot(self):
+        with self.lock:
+            report = {}
+            for (proxy, portal), stats in self.stats.items():
+                if not stats.requests:
+                    continue
+                entry = report.setdefault(mask(proxy), {'portals': {}})
+                if portal is None:
+                    entry.update(stats.as_dict())
+                else:
+                    entry['portals'][portal] = stats.as_dict()
+            return report
+
+
+# Outcome of a response for the proxy that carried it
+def classify(response):
+    if is_blocked(response):
+        return BLOCKED
+    if response.status_code in Config.retry_status_codes:
+        return FAILED
+    return OK
+
+
+# Proxy URL without its credentials, for reports and logs
+def mask(proxy):
+    scheme, _, rest = proxy.rpartition('://')
+    host = rest.rpartition('@')[2]
+    return f'{scheme}://{host}' if scheme else host
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Return the process wide pool of Config.proxies
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProxyPool()
+            get_metrics().add_section('proxies', _pool.snapshot)
+        return _pool
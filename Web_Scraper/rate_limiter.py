@@ -0,0 +1,95 @@
+# rate_limiter.py adaptive per-host rate limiting for the Job Portals
+
+import time
+import threading
+
+from config import Config
+
+
+class RateLimiter:
+    # Token bucket whose refill rate (requests per second) adapts to how the site responds
+    def __init__(self, rate=None, min_rate=None, max_rate=None, burst=None):
+        self.rate = rate or Config.rate_limit_start
+        self.min_rate = min_rate or Config.rate_limit_min
+        self.max_rate = max_rate or Config.rate_limit_max
+        self.burst = burst or Config.rate_limit_burst
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Block until a request may be sent
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    # Speed back up slowly after every good response
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + Config.rate_limit_increase)
+
+    # Halve the rate and pause the host when it throttles or blocks us
+    def on_throttle(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * Config.rate_limit_decrease)
+            self.tokens = 0.0
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        print(f'Throttled, slowing down to {self.rate:.2f} requests/sec')
+
+    # Feed a response back into the limiter
+    def record(self, response):
+        if is_throttled(response):
+            self.on_throttle(retry_after_seconds(response))
+        else:
+            self.on_success()
+
+
+# Check whether a response is a throttle/block answer rather than real content
+def is_throttled(response):
+    if response.status_code in Config.throttle_status_codes:
+        return True
+    return has_block_marker(response)
+
+
+# Look for captcha / access denied markers at the top of an HTML response
+def has_block_marker(response):
+    content_type = response.headers.get('Content-Type', '')
+    if 'html' in content_type:
+        text = response.text[:Config.block_page_scan_bytes]
+        return any(marker in text for marker in Config.block_page_markers)
+    return False
+
+
+# Read the Retry-After header (seconds form only), capped so one answer can't stall a run
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if value and value.strip().isdigit():
+        return min(float(value), Config.rate_limit_max_pause)
+    return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+# Return the limiter for a host, creating it on first use. Each proxy (route) reaches the host from its own
+# address, so it gets a limiter of its own
+def get_limiter(host, route=None):
+    with _limiters_lock:
+        limiter = _limiters.get((host, route))
+        if limiter is None:
+            limiter = RateLimiter(rate=Config.rate_limit_hosts.get(host))
+            _limiters[(host, route)] = limiter
+        return limiter
@@ -0,0 +1,176 @@
+# resilience.py retries, block detection, circuit breaking and adaptive concurrency per Job Portal
+
+import time
+import random
+import threading
+import requests
+
+from config import Config
+from collections import deque
+from metrics import get_metrics
+from contextlib import contextmanager
+from rate_limiter import has_block_marker
+
+
+# Raised instead of sending a request while a portal's circuit is open
+class PortalUnavailable(requests.RequestException):
+    pass
+
+
+# Raised when a portal answers with a block page (403 or a captcha/denied page) instead of results
+class BlockedPage(requests.RequestException):
+    pass
+
+
+# Check whether a response is the portal refusing us rather than a result page
+def is_blocked(response):
+    return response.status_code in Config.block_status_codes or has_block_marker(response)
+
+
+# Full jitter: a random wait up to the exponential backoff of the attempt
+def backoff_delay(attempt):
+    return random.uniform(0, min(Config.retry_max_delay, Config.retry_base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    # Opens after a run of failed requests; once open_seconds passed one trial request is let through
+    def __init__(self, portal, failure_threshold=None, open_seconds=None):
+        self.portal = portal
+        self.failure_threshold = failure_threshold or Config.circuit_failure_threshold
+        self.open_seconds = open_seconds or Config.circuit_open_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None and (self.trial_running or time.monotonic() - self.opened_at < self.open_seconds)
+
+    # Claim the right to send a request, False while the circuit is open
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.trial_running = True
+            return True
+
+    def on_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                print(f'{self.portal} answered again, closing its circuit')
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+                print(f'{self.portal} failed {self.failures} requests in a row, not sending it more requests for {self.open_seconds}s')
+
+
+class AdaptiveConcurrency:
+    # AIMD limit on requests in flight: +1/limit per success, halved when the recent error rate passes the threshold
+    def __init__(self, max_limit):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=Config.concurrency_window)
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def record(self, ok):
+        with self.condition:
+            self.outcomes.append(ok)
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif self.outcomes.count(False) / len(self.outcomes) > Config.concurrency_error_threshold:
+                self.limit = max(1.0, self.limit / 2)
+                # Judge the new limit on fresh outcomes
+                self.outcomes.clear()
+            self.condition.notify_all()
+
+
+class PortalGuard:
+    def __init__(self, portal):
+        self.portal = portal
+        self.breaker = CircuitBreaker(portal)
+        self.concurrency = AdaptiveConcurrency(Config.portal_concurrency.get(portal, 1))
+
+    def is_open(self):
+        return self.breaker.is_open()
+
+    # Send a request through send(), retrying transient failures with backoff. Raises PortalUnavailable while
+    # the circuit is open and BlockedPage on a block page, other error statuses are returned after the last retry
+    def call(self, send):
+        metrics = get_metrics()
+
+        if not self.breaker.allow():
+            metrics.count('skipped_requests', 1, self.portal)
+            raise PortalUnavailable(f'{self.portal} is not answering, its circuit is open')
+        # A request let through an open circuit is its trial and keeps retrying on its own
+        trial = self.breaker.opened_at is not None
+
+        for attempt in range(Config.retry_attempts + 1):
+            if attempt and not trial and self.breaker.is_open():
+                metrics.count('skipped_requests', 1, self.portal)
+                raise PortalUnavailable(f'{self.portal} is not answering, its circuit is open')
+
+            response, error = None, None
+            with self.concurrency.slot():
+                try:
+                    response = send()
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+
+            if response is not None and is_blocked(response):
+                metrics.count('blocked_responses', 1, self.portal)
+                self.concurrency.record(False)
+                self.breaker.on_failure()
+                raise BlockedPage(f'{self.portal} returned a block page (status {response.status_code})', response=response)
+
+            transient = error is not None or (response.status_code in Config.retry_status_codes and not getattr(response, 'from_cache', False))
+            self.concurrency.record(not transient)
+            if not transient:
+                self.breaker.on_success()
+                return response
+
+            if attempt == Config.retry_attempts:
+                self.breaker.on_failure()
+                if error is not None:
+                    raise error
+                return response
+
+            metrics.count('retries', 1, self.portal)
+            time.sleep(backoff_delay(attempt))
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+# Return the guard of a portal, creating it on first use
+def get_guard(portal):
+    with _guards_lock:
+        guard = _guards.get(portal)
+        if guard is None:
+            guard = PortalGuard(portal)
+            _guards[portal] = guard
+        return guard
@@ -0,0 +1,150 @@
+# response_cache.py on-disk HTTP response cache for the Job Portals
+
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+
+from config import Config
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache:
+    # mode is "off" (always fetch), "on" (serve fresh entries, store new ones) or "replay" (never touch the network)
+    def __init__(self, directory=None, mode=None, max_bytes=None):
+        self.directory = directory or Config.cache_directory
+        self.mode = mode or Config.cache_mode
+        self.max_bytes = max_bytes or Config.cache_max_bytes
+        self.lock = threading.Lock()
+        self.size = None
+
+    @property
+    def enabled(self):
+        return self.mode in ('on', 'replay')
+
+    @property
+    def replay(self):
+        return self.mode == 'replay'
+
+    # Entries are addressed by a hash of the request, so the same url and params always land in the same file
+    def key(self, url, params=None):
+        request = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def paths(self, key):
+        folder = os.path.join(self.directory, key[:2])
+        return os.path.join(folder, key + '.json'), os.path.join(folder, key + '.body')
+
+    # Return the cached response for a request, or None when it is missing or older than the portal's TTL
+    def get(self, url, params=None, portal=None):
+        meta_path, body_path = self.paths(self.key(url, params))
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            ttl = Config.cache_ttl.get(portal, Config.cache_default_ttl)
+            if not self.replay and time.time() - meta['fetched_at'] > ttl:
+                return None
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Touch the entry so eviction drops the least recently used ones first
+        os.utime(meta_path, None)
+        return self.build_response(meta, body)
+
+    # Store a successful response
+    def put(self, response, url, params=None, portal=None):
+        if response.status_code != 200:
+            return
+
+        meta_path, body_path = self.paths(self.key(url, params))
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        replaced_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        meta = {
+            'url': response.url,
+            'portal': portal,
+            'status_code': response.status_code,
+            'headers': {name: value for name, value in response.headers.items() if name.lower() in ('content-type', 'content-encoding')},
+            'encoding': response.encoding,
+            'fetched_at': time.time(),
+        }
+
+        # Write to temp files first so a reader never sees a half written entry
+        for path, data, mode in ((body_path, response.content, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, mode) as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.current_size()
+            else:
+                self.size += len(response.content) - replaced_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def build_response(self, meta, body):
+        response = requests.models.Response()
+        response.status_code = meta['status_code']
+        response._content = body
+        response.headers = CaseInsensitiveDict(meta.get('headers') or {})
+        response.encoding = meta.get('encoding')
+        response.url = meta['url']
+        response.from_cache = True
+        return response
+
+    # Response returned in replay mode when a request was never recorded
+    def miss_response(self, url):
+        response = requests.models.Response()
+        response.status_code = 504
+        response._content = b''
+        response.url = url
+        response.from_cache = True
+        print(f'Replay cache miss for {url}')
+        return response
+
+    def entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json'):
+                    meta_path = os.path.join(root, name)
+                    body_path = meta_path[:-len('.json')] + '.body'
+                    try:
+                        yield os.path.getmtime(meta_path), os.path.getsize(body_path), meta_path, body_path
+                    except OSError:
+                        continue
+
+    def current_size(self):
+        if self.size is None:
+            self.size = sum(size for _, size, _, _ in self.entries())
+        return self.size
+
+    # Drop least recently used entries until the cache is back under 90% of its size limit
+    def evict(self):
+        target = self.max_bytes * 0.9
+        for _, size, meta_path, body_path in sorted(self.entries()):
+            if self.size <= target:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Return the process wide response cache
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
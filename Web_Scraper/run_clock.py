@@ -0,0 +1,53 @@
+# run_clock.py one clock per scraper run, so every row of a run carries the same scrape time
+
+import pytz
+import threading
+
+from config import Config
+from metrics import reset_metrics
+from datetime import datetime
+
+# Time zones are built once instead of on every page
+UTC = pytz.utc
+CST = pytz.timezone('America/Chicago')
+
+
+class RunClock:
+    # The moment the run started, every scrape time of the run is derived from it
+    def __init__(self, started=None):
+        self.started = started or datetime.now(UTC)
+
+    # Run start in US Central time
+    def cst(self):
+        return self.started.astimezone(CST)
+
+    # Run start in the machine's local time, without a time zone like datetime.now()
+    def local(self):
+        return self.started.astimezone().replace(tzinfo=None)
+
+    # Local date of the run
+    def today(self):
+        return self.local().date()
+
+
+_clock = None
+_clock_lock = threading.Lock()
+
+
+# Return the clock of the current run, started on first use
+def get_clock():
+    global _clock
+    with _clock_lock:
+        if _clock is None:
+            _clock = RunClock()
+        return _clock
+
+
+# Start a new run clock with fresh metrics and move the output paths to its day, called once at the start of every run
+def start_run(started=None):
+    global _clock
+    with _clock_lock:
+        reset_metrics()
+        _clock = RunClock(started)
+        Config.set_run_day(_clock.today().strftime('%Y-%m-%d'))
+        return _clock
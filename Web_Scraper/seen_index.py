@@ -0,0 +1,116 @@
+# seen_index.py persistent index of job IDs already scraped from each portal
+
+import os
+import math
+import sqlite3
+import hashlib
+import threading
+
+from config import Config
+from datetime import datetime, timezone
+
+
+# Skip missing IDs, job_id == job_id is False for NaN
+def valid_id(job_id):
+    return job_id is not None and job_id == job_id and job_id != ''
+
+
+class BloomFilter:
+    # Sized for capacity items at the given false positive rate
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class SeenIndex:
+    # Job IDs with first/last seen timestamps live in SQLite, a Bloom filter in front answers most "never seen" checks from memory
+    def __init__(self, portal, directory=None):
+        self.portal = portal
+        self.directory = directory or Config.seen_index_directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.bloom_path = os.path.join(self.directory, f'{portal}.bloom')
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(os.path.join(self.directory, 'seen_jobs.sqlite'), check_same_thread=False, timeout=30)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS seen_jobs ('
+            'portal TEXT NOT NULL, job_id TEXT NOT NULL, first_seen TEXT NOT NULL, last_seen TEXT NOT NULL, '
+            'PRIMARY KEY (portal, job_id)) WITHOUT ROWID'
+        )
+        self.connection.commit()
+        self.bloom = self.load_bloom()
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM seen_jobs WHERE portal = ?', (self.portal,)).fetchone()[0]
+
+    # Load the saved filter, rebuilding it from the table when it is missing or out of date
+    def load_bloom(self):
+        bloom = BloomFilter(Config.seen_index_capacity, Config.seen_index_error_rate)
+        count = self.count()
+        try:
+            with open(self.bloom_path, 'rb') as f:
+                saved_count = int.from_bytes(f.read(8), 'little')
+                bits = f.read()
+            if saved_count == count and len(bits) == len(bloom.bits):
+                bloom.bits = bytearray(bits)
+                return bloom
+        except OSError:
+            pass
+
+        for (job_id,) in self.connection.execute('SELECT job_id FROM seen_jobs WHERE portal = ?', (self.portal,)):
+            bloom.add(job_id)
+        return bloom
+
+    def save_bloom(self):
+        temp_path = self.bloom_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(self.count().to_bytes(8, 'little'))
+            f.write(self.bloom.bits)
+        os.replace(temp_path, self.bloom_path)
+
+    def seen(self, job_id):
+        if not valid_id(job_id) or str(job_id) not in self.bloom:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT 1 FROM seen_jobs WHERE portal = ? AND job_id = ?', (self.portal, str(job_id))
+            ).fetchone()
+        return row is not None
+
+    # True when every job on a page was captured by an earlier run
+    def all_seen(self, job_ids):
+        job_ids = [job_id for job_id in job_ids if valid_id(job_id)]
+        return bool(job_ids) and all(self.seen(job_id) for job_id in job_ids)
+
+    # Record the jobs written by this run, keeping the first seen time of jobs we already knew
+    def mark(self, job_ids, seen_at=None):
+        seen_at = seen_at or datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        rows = [(self.portal, str(job_id), seen_at, seen_at) for job_id in set(job_ids) if valid_id(job_id)]
+
+        with self.lock:
+            self.connection.executemany(
+                'INSERT INTO seen_jobs (portal, job_id, first_seen, last_seen) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (portal, job_id) DO UPDATE SET last_seen = excluded.last_seen',
+                rows,
+            )
+            self.connection.commit()
+            for row in rows:
+                self.bloom.add(row[1])
+            self.save_bloom()
+
+    def close(self):
+        self.connection.close()
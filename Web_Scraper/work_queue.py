@@ -0,0 +1,333 @@
+# work_queue.py durable queue of (portal, keyword, page) tasks, so one run can be spread over worker processes and hosts
+#
+#     python work_queue.py plan                 queue the first pages of every portal and keyword for today's run
+#     python work_queue.py work                 lease and scrape tasks until the run has none left, start as many as you like
+#     python work_queue.py merge                write the usual per-portal outputs once every task finished
+#     python work_queue.py run --workers 4      plan, start local workers and merge in one go
+#     python work_queue.py status
+#
+# Workers on other hosts need the queue database and the results folder on a shared volume (see Config.queue_journal_mode).
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import subprocess
+
+from config import Config
+from portals import PORTALS, load_scraper
+from checkpoint import unit_filename
+from contextlib import contextmanager
+from output_writer import StreamingWriter
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        portals TEXT NOT NULL,
+        keywords TEXT NOT NULL,
+        planned_at REAL NOT NULL,
+        merged_at REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT NOT NULL,
+        portal TEXT NOT NULL,
+        keyword TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        lease_expires REAL,
+        rows INTEGER,
+        result_path TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        UNIQUE (run_id, portal, keyword, page)
+    )''',
+    'CREATE INDEX IF NOT EXISTS tasks_state ON tasks (run_id, state, lease_expires)',
+]
+
+# File a task's rows are saved to, the folder can be on a volume shared by every worker
+def result_path(run_id, portal, keyword, page):
+    return os.path.join(Config.queue_results_directory, run_id, portal, unit_filename(keyword, page))
+
+
+class WorkQueue:
+    def __init__(self, path=None):
+        self.path = path or Config.queue_path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Autocommit, transactions are opened explicitly with BEGIN IMMEDIATE so two workers never lease the same task
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(f'PRAGMA journal_mode = {Config.queue_journal_mode}')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+
+    @contextmanager
+    def transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def add_tasks(self, run_id, tasks):
+        now = time.time()
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO tasks (run_id, portal, keyword, page, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [(run_id, portal, keyword, page, now) for portal, keyword, page in tasks],
+        )
+
+    # Queue the first pages of every portal and keyword, the other pages are queued as those pages finish
+    def plan(self, run_id, portals, keywords):
+        tasks = [(portal, keyword, page) for portal in portals for keyword in keywords for page in load_scraper(portal).first_pages()]
+        with self.transaction():
+            self.connection.execute(
+                'INSERT OR IGNORE INTO runs (run_id, portals, keywords, planned_at) VALUES (?, ?, ?, ?)',
+                (run_id, json.dumps(portals), json.dumps(keywords), time.time()),
+            )
+            self.add_tasks(run_id, tasks)
+        print(f'Planned run {run_id}: {len(tasks)} tasks for {len(portals)} portals and {len(keywords)} keywords')
+
+    def run_info(self, run_id):
+        row = self.connection.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return dict(row, portals=json.loads(row['portals']), keywords=json.loads(row['keywords'])) if row else None
+
+    # Hand the next task to a worker. Leases that were not renewed in time are handed out again,
+    # tasks that used up their attempts that way are given up
+    def lease(self, run_id, worker):
+        now = time.time()
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease expired too often', worker = NULL, updated_at = ? "
+                "WHERE run_id = ? AND state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, run_id, now, Config.queue_max_attempts),
+            )
+            row = self.connection.execute(
+                "SELECT id, portal, keyword, page, attempts FROM tasks "
+                "WHERE run_id = ? AND (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY page, id LIMIT 1",
+                (run_id, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker, now + Config.queue_lease_seconds, now, row['id']),
+            )
+        return dict(row, attempts=row['attempts'] + 1)
+
+    # Extend a running task's lease, False when the lease was lost to another worker
+    def heartbeat(self, task, worker):
+        now = time.time()
+        cursor = self.connection.execute(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+            (now + Config.queue_lease_seconds, now, task['id'], worker),
+        )
+        return cursor.rowcount == 1
+
+    # Store a task's result and queue the pages it leads to, in one transaction
+    def complete(self, run_id, task, worker, path, rows, next_pages):
+        with self.transaction():
+            cursor = self.connection.execute(
+                "UPDATE tasks SET state = 'done', rows = ?, result_path = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (rows, path, time.time(), task['id'], worker),
+            )
+            if cursor.rowcount != 1:
+                print(f"Lost the lease of {task['portal']} {task['keyword']} page {task['page']}, dropping its result")
+                return False
+            self.add_tasks(run_id, [(task['portal'], task['keyword'], page) for page in next_pages])
+        return True
+
+    # Put a failed task back for another try, or give up on it after queue_max_attempts
+    def fail(self, task, worker, error):
+        state = 'failed' if task['attempts'] >= Config.queue_max_attempts else 'pending'
+        self.connection.execute(
+            "UPDATE tasks SET state = ?, error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND state = 'leased'",
+            (state, str(error)[:500], time.time(), task['id'], worker),
+        )
+
+    # Tasks still waiting or running, finished tasks may still add more
+    def unfinished(self, run_id):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE run_id = ? AND state IN ('pending', 'leased')", (run_id,)
+        ).fetchone()[0]
+
+    def results(self, run_id, portal):
+        rows = self.connection.execute(
+            "SELECT result_path FROM tasks WHERE run_id = ? AND portal = ? AND state = 'done' AND result_path IS NOT NULL ORDER BY id",
+            (run_id, portal),
+        )
+        return [row['result_path'] for row in rows]
+
+    def status(self, run_id):
+        return [dict(row) for row in self.connection.execute(
+            'SELECT portal, state, COUNT(*) AS tasks, COALESCE(SUM(rows), 0) AS rows FROM tasks WHERE run_id = ? GROUP BY portal, state ORDER BY portal, state',
+            (run_id,),
+        )]
+
+    def mark_merged(self, run_id):
+        self.connection.execute('UPDATE runs SET merged_at = ? WHERE run_id = ?', (time.time(), run_id))
+
+    def close(self):
+        self.connection.close()
+
+
+class Worker:
+    def __init__(self, queue, run_id, name=None):
+        self.queue = queue
+        self.run_id = run_id
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.scrapers = {}
+        self.current = None
+        self.stopped = threading.Event()
+
+    def scraper(self, portal):
+        if portal not in self.scrapers:
+            self.scrapers[portal] = load_scraper(portal)
+        return self.scrapers[portal]
+
+    # Renew the lease of the running task from a second connection while the main thread scrapes
+    def heartbeat(self):
+        queue = WorkQueue(self.queue.path)
+        while not self.stopped.wait(Config.queue_heartbeat_seconds):
+            task = self.current
+            if task is not None and not queue.heartbeat(task, self.name):
+                print(f"Lease of {task['portal']} {task['keyword']} page {task['page']} was lost")
+        queue.close()
+
+    # Scrape a task and save its rows next to the queue, the file is renamed into place so it is never half written
+    def execute(self, task):
+        dataframe, next_pages = self.scraper(task['portal']).scrape_page(task['keyword'], task['page'])
+        if dataframe is None or dataframe.empty:
+            return None, 0, next_pages
+
+        path = result_path(self.run_id, task['portal'], task['keyword'], task['page'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{self.name}.tmp'
+        dataframe.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+        return path, len(dataframe), next_pages
+
+    # Work until the run has no task left that is waiting or running
+    def run(self):
+        heartbeat = threading.Thread(target=self.heartbeat, name='heartbeat', daemon=True)
+        heartbeat.start()
+        finished = 0
+
+        try:
+            while True:
+                task = self.queue.lease(self.run_id, self.name)
+                if task is None:
+                    if not self.queue.unfinished(self.run_id):
+                        break
+                    # Tasks running on other workers may still queue more pages
+                    time.sleep(Config.queue_poll_seconds)
+                    continue
+
+                self.current = task
+                try:
+                    path, rows, next_pages = self.execute(task)
+                except Exception as e:
+                    print(f"Task {task['portal']} {task['keyword']} page {task['page']} failed: {e}")
+                    self.queue.fail(task, self.name, e)
+                else:
+                    if self.queue.complete(self.run_id, task, self.name, path, rows, next_pages):
+                        finished += 1
+                finally:
+                    self.current = None
+        finally:
+            self.stopped.set()
+            heartbeat.join()
+
+        print(f'Worker {self.name} finished {finished} tasks')
+        return finished
+
+
+# Write each portal's output from the finished tasks of a run, like the end of a scraper's run()
+def merge(queue, run_id):
+    info = queue.run_info(run_id)
+    if info is None:
+        print(f'Run {run_id} was never planned')
+        return False
+    if info['merged_at']:
+        print(f'Run {run_id} was already merged')
+        return False
+    unfinished = queue.unfinished(run_id)
+    if unfinished:
+        print(f'Run {run_id} still has {unfinished} unfinished tasks, merge once the workers are done')
+        return False
+
+    # The run ID is the day folder the outputs go to
+    Config.set_run_day(run_id)
+    for portal in info['portals']:
+        scraper = load_scraper(portal)
+        writer = StreamingWriter(portal)
+        for path in queue.results(run_id, portal):
+            if os.path.exists(path):
+                writer.add_part(path)
+        job_ids = writer.finalize(exclude=scraper.output_exclude, id_column=scraper.id_column)
+        scraper.seen_index.mark(job_ids)
+        if Config.write_delta:
+            from delta import write_delta
+            write_delta(portal)
+        if Config.enrich_details:
+            from enrichment import enrich_portal
+            enrich_portal(portal)
+
+    queue.mark_merged(run_id)
+    return True
+
+
+# Start local worker processes and wait for all of them
+def start_workers(run_id, count):
+    command = [sys.executable, os.path.abspath(__file__), 'work', '--run-id', run_id]
+    processes = [subprocess.Popen(command) for _ in range(count)]
+    return [process.wait() for process in processes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spread a scraping run over worker processes and hosts')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('plan', 'queue the first pages of a run'), ('work', 'lease and scrape tasks'),
+                            ('merge', 'write the outputs of a finished run'), ('run', 'plan, work with local workers and merge'),
+                            ('status', 'show task counts of a run')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--run-id', default=Config.subdirectory, help='defaults to today, the day folder the outputs go to')
+        if name in ('plan', 'run'):
+            command.add_argument('--portals', nargs='+', default=list(PORTALS), choices=list(PORTALS))
+            command.add_argument('--keywords', nargs='+', default=Config.keywords)
+        if name == 'work':
+            command.add_argument('--name', help='worker name, defaults to host-pid')
+        if name == 'run':
+            command.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    args = parser.parse_args()
+    queue = WorkQueue()
+
+    if args.command in ('plan', 'run'):
+        queue.plan(args.run_id, args.portals, args.keywords)
+    if args.command == 'work':
+        Worker(queue, args.run_id, args.name).run()
+    if args.command == 'run':
+        start_workers(args.run_id, args.workers)
+    if args.command in ('merge', 'run'):
+        merge(queue, args.run_id)
+    if args.command == 'status':
+        for row in queue.status(args.run_id):
+            print(f"{row['portal']:<13} {row['state']:<8} {row['tasks']:>5} tasks {row['rows']:>7} rows")
+
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,32 @@
 import re
-import os
-import time
 import json
-import pytz
-import random
 import warnings
 import requests
-import numpy as np
 import pandas as pd
 
 from config import Config
-from bs4 import BeautifulSoup
-from datetime import datetime
+from http_client import get_client
+from metrics import get_metrics
+from bs4 import SoupStrainer
+from parsing import make_soup, extract_script, extract_tag_text
+from seen_index import SeenIndex
+from checkpoint import run_units
+from job_record import URL_JOB_ID_PATTERNS
+from run_clock import get_clock
 from urllib.parse import urlparse, parse_qs
 
 warnings.filterwarnings('ignore')
 
 class Wrapper:
+    portal = "ZipRecruiter"
+    # Rows left out of the output and the column that identifies a job
+    output_exclude = {'EmploymentType': 'Full-Time'}
+    id_column = 'JobID'
+
     def __init__(self):
-        pass
+        self.client = get_client()
+        self.max_workers = Config.portal_concurrency["ZipRecruiter"]
+        self.seen_index = SeenIndex("ZipRecruiter")
 
     # Extract digits from the given text
     def extract_digits(self, text):
@@ -44,30 +52,28 @@ class Wrapper:
 
     # Extract job ID from the given URL
     def extract_job_id(self, url):
-        if "jid=" in url:
-            job_id_part = url.split("jid=")[1]
-            job_id = job_id_part.split("&")[0]
-            return job_id
-        else:
-            return None
+        match = re.search(URL_JOB_ID_PATTERNS['ZipRecruiter'], url)
+        return match.group(1) if match else None
 
     # Find and process job list data script
     def get_data(self, soup):
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        cst_timezone = pytz.timezone('America/Chicago')
+        script = soup.find('script', id='js_variables')
 
-        current_time_ist = datetime.now(ist_timezone)
-        current_time_cst = current_time_ist.astimezone(cst_timezone)
-        try:
-            script = soup.find('script', id='js_variables')
+        # A search without results has no job list
+        if not script or not script.string:
+            print("Script content not found.")
+            return pd.DataFrame()
 
-            if not script or not script.string:
-                print("Script content not found.")
-                return None
+        return self.get_data_from_script(script.string)
 
-            script_content = script.string
+    # Process the js_variables script content into a dataframe
+    def get_data_from_script(self, script_content):
+        current_time_cst = get_clock().cst()
+        try:
             json_data = json.loads(script_content)
             json_list = json_data.get('jobList', [])
+            if not json_list:
+                return pd.DataFrame()
 
             selected_fields = ['Title', 'City', 'FormattedSalaryShort', 'EmploymentType', 'EmploymentTags', 'JobURL', 'SaveJobURL']
             selected_data_list = []
@@ -119,89 +125,91 @@ class Wrapper:
             print(f"Error in outer try block: {e}")
             return None
 
+    # Fetch a single search results page, None when the site blocked or failed the request
+    def fetch_page(self, url, keyword=None, page=None):
+        try:
+            with get_metrics().page("ZipRecruiter", keyword, page):
+                response = self.client.get(url, portal="ZipRecruiter")
+        except requests.RequestException as e:
+            print(f"Sorry, could not fetch page {page} for {keyword}: {e}")
+            return None
+
+        if response.status_code == 200:
+            # Do something with the response here
+            print('Success!')
+        else:
+            # Print an error message
+            print(f"Sorry, the website blocked your connection. Status Code: {response.status_code}")
+            return None
+
+        return response.content
+
+    # Parse a raw page, only pulling out the js_variables script and falling back to a full parse if it moved
+    def parse_page(self, content):
+        metrics = get_metrics()
+        with metrics.stage('parse', 'ZipRecruiter'):
+            script_content = extract_script(content, 'js_variables')
+
+        if script_content:
+            with metrics.stage('transform', 'ZipRecruiter'):
+                return self.get_data_from_script(script_content)
+
+        with metrics.stage('parse', 'ZipRecruiter'):
+            soup = make_soup(content)
+        with metrics.stage('transform', 'ZipRecruiter'):
+            return self.get_data(soup)
+
+    # Read the number of results from the page headline
+    def get_result_count(self, content):
+        headline = extract_tag_text(content, 'job_results_headline', 'h1')
+
+        if headline is None:
+            soup = make_soup(content, parse_only=SoupStrainer('div', class_='job_results_headline'))
+            headline = soup.find('h1').get_text(strip=True)
+
+        return int(self.extract_digits(headline))
+
+    # Search results url of a keyword, the first page has no page parameter
+    def page_url(self, keyword, page=1):
+        url = f'https://www.ziprecruiter.com/jobs-search?search={keyword}&location=&company=&refine_by_location_type=&radius=&days=&refine_by_salary=&refine_by_employment=employment_type%3Aemployment_type%3Acontract&'
+        return url if page == 1 else f'{url}page={page}'
+
+    # Pages to fetch after the first one, based on the result count of the first page
+    def follow_up_pages(self, keyword, result, dataframe1):
+        if 20 < result < 100:
+            pages = range(2, 4)
+        elif 100 < result:
+            pages = range(2, 7)
+        else:
+            print('This keyword has only this data')
+            pages = []
+
+        # In incremental mode skip the remaining pages once the newest page holds nothing new
+        if Config.incremental and dataframe1 is not None and self.seen_index.all_seen(dataframe1['JobID']):
+            print(f'All jobs on the first page for {keyword} were already scraped, skipping the rest')
+            pages = []
+
+        return list(pages)
+
+    # Pages every keyword starts from
+    def first_pages(self):
+        return [1]
+
+    # Scrape one (keyword, page) unit on its own, returns its dataframe (None if it failed) and the pages it leads to
+    def scrape_page(self, keyword, page):
+        with get_metrics().page("ZipRecruiter", keyword, page):
+            content = self.fetch_page(self.page_url(keyword, page), keyword, page)
+            if content is None:
+                return None, []
+
+            dataframe1 = self.parse_page(content)
+            if page != 1 or dataframe1 is None or dataframe1.empty:
+                return dataframe1, []
+            return dataframe1, self.follow_up_pages(keyword, self.get_result_count(content), dataframe1)
+
+    # Scrape every keyword page by page, resuming from the checkpoint of an interrupted run
     def run(self):
-        proxy = Config.proxy
-        proxies = {"http": proxy, "https": proxy}
-
-        output_directory = Config.output_directory
-        subdirectory = Config.subdirectory
-        os.makedirs(os.path.join(output_directory, subdirectory), exist_ok=True)
-        
-
-        all_dataframes = []
-
-        for keyword in Config.keywords:
-            Config.keyword = keyword
-            url = f'https://www.ziprecruiter.com/jobs-search?search={keyword}&location=&company=&refine_by_location_type=&radius=&days=&refine_by_salary=&refine_by_employment=employment_type%3Aemployment_type%3Acontract&'
-            user_agent = random.choice(Config.USER_AGENT_LIST)
-            headers = {'User-Agent': user_agent}
-            response = requests.get(url, headers=headers, proxies=proxies, verify=False)
-
-            if response.status_code == 200:
-                # Do something with the response here
-                print('Success!')
-            else:
-                # Print an error message
-                print(f"Sorry, the website blocked your connection. Status Code: {response.status_code}")
-
-            soup = BeautifulSoup(response.content, 'html.parser')
-            a = BeautifulSoup(str(soup.find('div', class_='job_results_headline')), 'html.parser').find('h1').get_text(strip=True)
-            result = int(self.extract_digits(a))
-            dataframe1 = self.get_data(soup)
-            all_dataframes.append(dataframe1)
-
-            if 20 < result < 100:
-                for j in range(2, 4):
-                    url2 = f'https://www.ziprecruiter.com/jobs-search?search={keyword}&location=&company=&refine_by_location_type=&radius=&days=&refine_by_salary=&refine_by_employment=employment_type%3Aemployment_type%3Acontract&page={j}'
-
-                    user_agent = random.choice(Config.USER_AGENT_LIST)
-                    headers = {'User-Agent': user_agent}
-                    res2 = requests.get(url2, headers=headers, proxies=proxies, verify=False)
-
-                    if res2.status_code == 200:
-                        # Do something with the response here
-                        print('Success!')
-                    else:
-                        # Print an error message
-                        print(f"Sorry, the website blocked your connection. Status Code: {res2.status_code}")
-
-                    soup2 = BeautifulSoup(res2.content, 'html.parser')
-                    dataframe3 = self.get_data(soup2)
-                    all_dataframes.append(dataframe3)
-                    print('success for page ' + str(j))
-            elif 100 < result:
-                for i in range(2, 7):
-                    url1 = f'https://www.ziprecruiter.com/jobs-search?search={keyword}&location=&company=&refine_by_location_type=&radius=&days=&refine_by_salary=&refine_by_employment=employment_type%3Aemployment_type%3Acontract&page={i}'
-
-                    user_agent = random.choice(Config.USER_AGENT_LIST)
-                    headers = {'User-Agent': user_agent}
-                    res1 = requests.get(url1, headers=headers, proxies=proxies, verify=False)
-
-                    if res1.status_code == 200:
-                        # Do something with the response here
-                        print('Success!')
-                    else:
-                        # Print an error message
-                        print(f"Sorry, the website blocked your connection. Status Code: {res1.status_code}")
-
-                    soup1 = BeautifulSoup(res1.content, 'html.parser')
-                    dataframe2 = self.get_data(soup1)
-                    all_dataframes.append(dataframe2)
-                    print('success for page ' + str(i))
-            else:
-                print('This keyword has only this data')
-
-        final_dataframe = pd.concat(all_dataframes)
-        final_dataframe = final_dataframe[final_dataframe['EmploymentType'] != 'Full-Time']
-        final_dataframe.drop_duplicates(inplace=True)
-
-        final_dataframe
-
-        output_path = Config.output_csv_path1
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        final_dataframe.to_csv(os.path.join(output_path, Config.output_csv_zip), index=False)
+        run_units(self)
 
 if __name__ == "__main__":
     wrapper = Wrapper()